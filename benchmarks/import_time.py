@@ -0,0 +1,98 @@
+"""Benchmark of the time to import the models of this app
+
+Runs Django setup in a fresh interpreter with ``python -X importtime``
+and reports the cumulative import time of the modules of this app
+and the slowest third party modules first imported by them.
+
+Usage: python benchmarks/import_time.py
+"""
+import os
+import re
+import subprocess
+import sys
+
+APP_NAME = "buybacks2"
+SLOWEST = 10
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Django imports apps and their models with importlib.import_module(),
+# which is not timed by -X importtime, unlike the import statement
+SETUP_CODE = """
+import sys
+import django
+import django.apps.config
+
+def import_module(name, package=None):
+    __import__(name)
+    return sys.modules[name]
+
+django.apps.config.import_module = import_module
+django.setup()
+"""
+
+
+def import_times() -> list:
+    """returns self and cumulative time in us, nesting level and module name
+    for all modules imported during Django setup in the order of the report
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+    env = dict(os.environ, PYTHONPATH=root)
+    env.setdefault("DJANGO_SETTINGS_MODULE", "testauth.settings")
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            SETUP_CODE,
+        ],
+        cwd=root,
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            times.append(
+                (
+                    int(match.group(1)),
+                    int(match.group(2)),
+                    len(match.group(3)),
+                    match.group(4),
+                )
+            )
+
+    return times
+
+
+def main():
+    times = import_times()
+    app_modules = []
+    third_party = []
+    # modules are reported after the modules they import,
+    # which are indented deeper
+    app_level = None
+    for self_us, cumulative_us, level, name in reversed(times):
+        if app_level is not None and level <= app_level:
+            app_level = None
+        if name.split(".")[0] == APP_NAME:
+            app_modules.append((cumulative_us, name))
+            if app_level is None:
+                app_level = level
+        elif app_level is not None:
+            third_party.append((self_us, name))
+
+    print(f"Cumulative import time of {APP_NAME} modules:")
+    for cumulative_us, name in reversed(app_modules):
+        print(f"{cumulative_us / 1000:9.1f} ms  {name}")
+
+    print(f"\nSlowest modules first imported by {APP_NAME} (self time):")
+    for self_us, name in sorted(third_party, reverse=True)[:SLOWEST]:
+        print(f"{self_us / 1000:9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
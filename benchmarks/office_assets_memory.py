@@ -0,0 +1,111 @@
+"""Benchmark of the peak memory to find the offices among the assets of a corp
+
+Fetches 200 pages of 1000 assets each in raw mode from a local ESI stub
+and keeps only the offices:
+- full_list: all pages are fetched into one list, which is filtered afterwards
+- streamed: assets are streamed page by page and filtered by the consumer
+- filtered: assets are filtered right after each page has been decoded,
+  as done when updating the offices of a corp
+
+Peak memory is measured with tracemalloc and includes the stub server.
+
+Usage: python benchmarks/office_assets_memory.py
+"""
+import os
+import random
+import sys
+import tracemalloc
+
+PAGES = 200
+ASSETS_PER_PAGE = 1000
+OFFICE_TYPE_ID = 27
+ASSETS_ESI_PATH = "Assets.get_corporations_corporation_id_assets"
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+def asset_pages() -> list:
+    """returns pages of assets of a large corp with a few offices"""
+    rnd = random.Random(42)
+    return [
+        [
+            {
+                "is_singleton": False,
+                "item_id": page * ASSETS_PER_PAGE + num,
+                "location_flag": "Hangar",
+                "location_id": 60000000 + rnd.randint(0, 5000),
+                "location_type": "station",
+                "quantity": rnd.randint(1, 10**6),
+                "type_id": (
+                    OFFICE_TYPE_ID if rnd.random() < 0.001 else rnd.randint(28, 50000)
+                ),
+            }
+            for num in range(ASSETS_PER_PAGE)
+        ]
+        for page in range(PAGES)
+    ]
+
+
+def main():
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testauth.settings")
+    import django
+
+    django.setup()
+
+    from django.test.utils import override_settings
+
+    from buybacks2.tests.esi_stub import StubESI
+
+    esi = StubESI().start()
+    esi.assets = asset_pages()
+    esi_client = esi.client()
+    try:
+        with override_settings(CACHES=LOCMEM_CACHES):
+            for mode in ("full_list", "streamed", "filtered"):
+                run(mode, esi_client)
+    finally:
+        esi.stop()
+
+
+def run(mode: str, esi_client):
+    from buybacks2.helpers import esi_fetch, esi_fetch_stream
+
+    def is_office(asset: dict) -> bool:
+        return asset["type_id"] == OFFICE_TYPE_ID
+
+    args = {"corporation_id": 98000001}
+    tracemalloc.start()
+    if mode == "full_list":
+        assets = esi_fetch(
+            ASSETS_ESI_PATH, args=args, has_pages=True, esi_client=esi_client, raw=True
+        )
+        offices = [asset for asset in assets if is_office(asset)]
+        del assets
+    elif mode == "streamed":
+        offices = [
+            asset
+            for asset in esi_fetch_stream(
+                ASSETS_ESI_PATH, args=args, esi_client=esi_client, raw=True
+            )
+            if is_office(asset)
+        ]
+    else:
+        offices = list(
+            esi_fetch_stream(
+                ASSETS_ESI_PATH,
+                args=args,
+                esi_client=esi_client,
+                raw=True,
+                record_filter=is_office,
+            )
+        )
+
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{mode:10s} offices={len(offices):4d} peak={peak / 2**20:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark of the CPU time to decode a large page of contracts from ESI
+
+Compares building the response with bravado, which validates the response
+and parses all fields incl. date-times, with raw mode,
+which only decodes the JSON.
+Both fetch the same recorded page of 1000 contracts from a local ESI stub,
+the CPU time of the stub server is not included.
+
+Usage: python benchmarks/raw_mode.py
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from time import thread_time
+
+ROUNDS = 20
+CONTRACTS = 1000
+CONTRACTS_ESI_PATH = "Contracts.get_corporations_corporation_id_contracts"
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+def recorded_page() -> list:
+    """returns a page of contracts as ESI returns them for a busy corp"""
+    rnd = random.Random(42)
+    issued = datetime(2021, 6, 1, tzinfo=timezone.utc)
+    contracts = []
+    for num in range(CONTRACTS):
+        date_issued = issued - timedelta(minutes=num * 17)
+        contracts.append(
+            {
+                "acceptor_id": 98000001,
+                "assignee_id": 98000001,
+                "availability": "personal",
+                "buyout": 0.0,
+                "collateral": 0.0,
+                "contract_id": 170000000 - num,
+                "date_accepted": (date_issued + timedelta(hours=3)).isoformat(),
+                "date_completed": (date_issued + timedelta(hours=3)).isoformat(),
+                "date_expired": (date_issued + timedelta(days=14)).isoformat(),
+                "date_issued": date_issued.isoformat(),
+                "days_to_complete": 0,
+                "end_location_id": 60003760,
+                "for_corporation": False,
+                "issuer_corporation_id": 1000000 + rnd.randint(0, 5000),
+                "issuer_id": 2110000000 + rnd.randint(0, 10**6),
+                "price": round(rnd.uniform(10**5, 10**9), 2),
+                "reward": 0.0,
+                "start_location_id": 60003760,
+                "status": "finished",
+                "title": f"Buyback {rnd.randint(1, 10 ** 6)}",
+                "type": "item_exchange",
+                "volume": round(rnd.uniform(1, 10**5), 2),
+            }
+        )
+    return contracts
+
+
+def main():
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testauth.settings")
+    import django
+
+    django.setup()
+
+    from django.test.utils import override_settings
+
+    from buybacks2.tests.esi_stub import StubESI
+
+    esi = StubESI().start()
+    esi.contracts = [recorded_page()]
+    esi_client = esi.client()
+    try:
+        with override_settings(CACHES=LOCMEM_CACHES):
+            run(esi_client)
+    finally:
+        esi.stop()
+
+
+def run(esi_client):
+    from buybacks2.helpers import esi_fetch
+
+    for raw in (False, True):
+        start = thread_time()
+        for _ in range(ROUNDS):
+            esi_fetch(
+                CONTRACTS_ESI_PATH,
+                args={"corporation_id": 98000001},
+                has_pages=True,
+                esi_client=esi_client,
+                raw=raw,
+            )
+        elapsed = (thread_time() - start) / ROUNDS
+        print(f"{'raw' if raw else 'bravado':8s} {elapsed * 1000:7.1f} ms CPU/page")
+
+
+if __name__ == "__main__":
+    main()
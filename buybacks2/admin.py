@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Corporation, Location, Office
+from .models import Corporation, Location, Office, SyncRun
 
 
 @admin.register(Corporation)
@@ -43,3 +43,28 @@ class OfficeAdmin(admin.ModelAdmin):
 
     def has_delete_permission(self, request, obj=None):
         return False
+
+
+@admin.register(SyncRun)
+class SyncRunAdmin(admin.ModelAdmin):
+    list_display = (
+        "started_at",
+        "corporation",
+        "kind",
+        "duration",
+        "success",
+        "pages",
+        "contracts_scanned",
+        "matches",
+        "db_queries",
+        "esi_errors",
+        "cache_hits",
+    )
+    list_filter = ("kind", "success", "corporation")
+    ordering = ("-started_at",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,12 +1,82 @@
-# from django.conf import settings
+from .utils import clean_setting
 
+HTTP_CACHE_BACKEND_DJANGO = "django"
+HTTP_CACHE_BACKEND_FILESYSTEM = "filesystem"
+HTTP_CACHE_BACKEND_SQLITE = "sqlite"
+HTTP_CACHE_BACKENDS = (
+    HTTP_CACHE_BACKEND_DJANGO,
+    HTTP_CACHE_BACKEND_FILESYSTEM,
+    HTTP_CACHE_BACKEND_SQLITE,
+)
+
+# max number of requests to ESI that are run in parallel for fetching one endpoint
+BUYBACKS2_ESI_MAX_WORKERS = clean_setting("BUYBACKS2_ESI_MAX_WORKERS", 4, min_value=1)
+
+# workers will pause until the ESI error limit is reset
+# once the remaining errors have dropped to this value
+BUYBACKS2_ESI_ERROR_LIMIT_THRESHOLD = clean_setting(
+    "BUYBACKS2_ESI_ERROR_LIMIT_THRESHOLD", 20
+)
+
+# max number of concurrent requests to ESI with the same token across all workers
+BUYBACKS2_ESI_MAX_CONCURRENT_REQUESTS_PER_TOKEN = clean_setting(
+    "BUYBACKS2_ESI_MAX_CONCURRENT_REQUESTS_PER_TOKEN", 8, min_value=1
+)
 
-# put your app settings here
+# number of workers matching the contracts of a corp in parallel
+BUYBACKS2_CONTRACTS_MATCH_WORKERS = clean_setting(
+    "BUYBACKS2_CONTRACTS_MATCH_WORKERS", 2, min_value=1
+)
+
+# hours between syncs of contracts for corps without open notifications
+BUYBACKS2_CONTRACTS_IDLE_SYNC_HOURS = clean_setting(
+    "BUYBACKS2_CONTRACTS_IDLE_SYNC_HOURS", 6, min_value=1
+)
+
+# max delay in seconds for spreading the periodic syncs of all corps
+BUYBACKS2_TASKS_JITTER_SECONDS = clean_setting("BUYBACKS2_TASKS_JITTER_SECONDS", 120)
+
+# number of days statistics of sync runs are kept by the cleanup task
+BUYBACKS2_SYNC_RUNS_RETENTION_DAYS = clean_setting(
+    "BUYBACKS2_SYNC_RUNS_RETENTION_DAYS", 30, min_value=1
+)
 
-"""
-EXAMPLE_SETTING_ONE = getattr(
-    settings,
-    'EXAMPLE_SETTING_ONE',
-    None
+# number of days after which locations are refreshed from ESI
+BUYBACKS2_LOCATIONS_REFRESH_DAYS = clean_setting(
+    "BUYBACKS2_LOCATIONS_REFRESH_DAYS", 7, min_value=1
 )
-"""
+
+# max number of locations refreshed from ESI per run of the refresh task
+BUYBACKS2_LOCATIONS_REFRESH_LIMIT = clean_setting(
+    "BUYBACKS2_LOCATIONS_REFRESH_LIMIT", 50, min_value=1
+)
+
+# backend for caching responses from HTTP APIs, e.g. Fuzzwork market
+# one of "filesystem", "sqlite" or "django" (e.g. Redis, shared by all nodes)
+BUYBACKS2_HTTP_CACHE_BACKEND = clean_setting(
+    "BUYBACKS2_HTTP_CACHE_BACKEND",
+    HTTP_CACHE_BACKEND_FILESYSTEM,
+    choices=HTTP_CACHE_BACKENDS,
+)
+
+# whether cached HTTP responses are compressed
+BUYBACKS2_HTTP_CACHE_COMPRESS = clean_setting("BUYBACKS2_HTTP_CACHE_COMPRESS", False)
+
+# max number of cached HTTP responses kept by the cleanup task, 0 for no limit
+# responses are removed first in, first out, i.e. oldest cached first
+BUYBACKS2_HTTP_CACHE_MAX_ENTRIES = clean_setting(
+    "BUYBACKS2_HTTP_CACHE_MAX_ENTRIES", 10000
+)
+
+# sink for metrics of requests to ESI and other HTTP APIs
+# one of "log", "statsd" or "prometheus", empty to disable metrics
+BUYBACKS2_METRICS_SINK = clean_setting("BUYBACKS2_METRICS_SINK", "")
+
+# host and port of the statsd server for the statsd metrics sink
+BUYBACKS2_METRICS_STATSD_HOST = clean_setting(
+    "BUYBACKS2_METRICS_STATSD_HOST", "localhost"
+)
+BUYBACKS2_METRICS_STATSD_PORT = clean_setting("BUYBACKS2_METRICS_STATSD_PORT", 8125)
+
+# bearer token that allows scraping the prometheus metrics without login
+BUYBACKS2_METRICS_TOKEN = clean_setting("BUYBACKS2_METRICS_TOKEN", "")
@@ -2,39 +2,67 @@
 
     Added features for all ESI requests:
     - Automatic page retry on 502, 503, 504 up to max retries with exponential backoff
-    - Automatic retrieval of all pages
-    - Automatic retrieval of variants for all requested languages
+    - Automatic retrieval of all pages, with pages fetched in parallel
+    - Streaming of all records of paged endpoints page by page
+    - Optional conditional requests with ETags
+    - Tracking when the last response of a request expires in the ESI cache
+    - Pausing all workers before the ESI error limit is reached
+    - Max number of concurrent requests per token across all workers
+    - Coroutine variants for fetching many requests at once with asyncio
+    - Optional raw mode returning decoded JSON without bravado models
+    - Optional filtering of records right after each page has been decoded
+    - Metrics for latency, retries, pages, ETag hits and the ESI error limit
+    - Automatic retrieval of variants for all requested languages in parallel
 """
-from time import sleep
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from functools import partial
+from hashlib import md5
+from threading import Lock
+from time import sleep, time
+from typing import Callable
+
+from bravado.exception import (
+    HTTPBadGateway,
+    HTTPError,
+    HTTPGatewayTimeout,
+    HTTPNotModified,
+    HTTPServiceUnavailable,
+    make_http_exception,
+)
 
-from bravado.exception import HTTPBadGateway, HTTPGatewayTimeout, HTTPServiceUnavailable
-from requests_cache import CachedSession
+from django.core.cache import cache
 
 from allianceauth.services.hooks import get_extension_logger
-from esi.clients import esi_client_factory
 from esi.models import Token
 
+from . import metrics
+from .app_settings import (
+    BUYBACKS2_ESI_ERROR_LIMIT_THRESHOLD,
+    BUYBACKS2_ESI_MAX_CONCURRENT_REQUESTS_PER_TOKEN,
+    BUYBACKS2_ESI_MAX_WORKERS,
+)
+
 logger = get_extension_logger(__name__)
 
 ESI_MAX_RETRIES = 3
 ESI_RETRY_SLEEP_SECS = 1
+ESI_ETAGS_CACHE_TIMEOUT = 3600 * 24
+ESI_EXPIRES_CACHE_TIMEOUT = 3600 * 24
+ESI_ERROR_LIMITED_STATUS_CODE = 420
+ESI_ERROR_LIMIT_RESET_AT_CACHE_KEY = "buybacks2_esi_error_limit_reset_at"
+ESI_REQUEST_SLOT_TIMEOUT = 60
+ESI_REQUEST_SLOT_SLEEP_SECS = 0.2
 
 _my_esi_client = None
-
-market_api = CachedSession(
-    "market.fuzzwork.cache",
-    backend="filesystem",
-    use_cache_dir=True,
-    expire_after=330,
-    cache_control=True,
-)
-esi_api = CachedSession(
-    "esi.cache",
-    backend="filesystem",
-    use_cache_dir=True,
-    expire_after=330,
-    cache_control=True,
-)
+_my_async_executor = None
+_my_market_api = None
+_my_esi_api = None
+_init_lock = Lock()
 
 
 def fuzzworkmarket_lookup(type_ids: [int] = None) -> dict:
@@ -44,11 +72,19 @@ def fuzzworkmarket_lookup(type_ids: [int] = None) -> dict:
     if len(type_ids) == 0:
         return {}
 
-    response = market_api.get(
-        "https://market.fuzzwork.co.uk/aggregates/",
-        params={
-            "types": ",".join([str(x) for x in type_ids]),
-            "station": 60003760,
+    with metrics.timer("market_request_duration_seconds"):
+        response = _market_api().get(
+            "https://market.fuzzwork.co.uk/aggregates/",
+            params={
+                "types": ",".join([str(x) for x in type_ids]),
+                "station": 60003760,
+            },
+        )
+    metrics.incr(
+        "http_cache_requests",
+        tags={
+            "api": "market",
+            "result": "hit" if getattr(response, "from_cache", False) else "miss",
         },
     )
 
@@ -64,12 +100,21 @@ def fuzzworkmarket_lookup(type_ids: [int] = None) -> dict:
     return result
 
 
+def cleanup_http_caches():
+    """removes expired and excess responses from all HTTP caches"""
+    from .http_cache import cleanup_session_cache
+
+    for session in (_market_api(), _esi_api()):
+        cleanup_session_cache(session)
+
+
 def esi_fetch(
     esi_path: str,
     args: dict = None,
     has_pages: bool = False,
     token: Token = None,
     esi_client: object = None,
+    raw: bool = False,
 ) -> dict:
     """returns an response object from ESI, will retry on some HTTP errors.
     will automatically return all pages if requested
@@ -82,6 +127,8 @@ def esi_fetch(
     - token: esi token from django-esi to be used with request
     - esi_client: esi client object from django-esi to be used for request
     instead of default esi client from this module
+    - raw: When set to True will return the decoded JSON of the response
+    without validating it and building models with bravado
     """
     _, request_object = _fetch_main(
         esi_path=esi_path,
@@ -90,10 +137,204 @@ def esi_fetch(
         has_pages=has_pages,
         esi_client=esi_client,
         token=token,
+        raw=raw,
     ).popitem()
     return request_object
 
 
+def esi_fetch_stream(
+    esi_path: str,
+    args: dict = None,
+    token: Token = None,
+    esi_client: object = None,
+    raw: bool = False,
+    record_filter: Callable = None,
+):
+    """returns a generator over all records of a paged endpoint from ESI,
+    will retry on some HTTP errors.
+
+    Records are yielded page by page as soon as the page has been fetched,
+    so only a few pages are kept in memory at any time.
+
+    Args:
+    - esi_path: Full path of esi route,
+    e.g. ``Assets.get_corporations_corporation_id_assets``
+    - args: arguments for ESI method as dict, e.g. ``{'corporation_id': 123}``
+    - token: esi token from django-esi to be used with request
+    - esi_client: esi client object from django-esi to be used for request
+    instead of default esi client from this module
+    - raw: When set to True will yield the decoded JSON records of the response
+    without validating them and building models with bravado
+    - record_filter: When set only records for which it returns True are yielded.
+    Other records are dropped as soon as each page has been decoded,
+    which keeps memory low when only a few records of a large endpoint are needed
+    """
+    for response_object_page in esi_fetch_pages(
+        esi_path=esi_path,
+        args=args,
+        token=token,
+        esi_client=esi_client,
+        raw=raw,
+        record_filter=record_filter,
+    ):
+        yield from response_object_page
+
+
+def esi_fetch_pages(
+    esi_path: str,
+    args: dict = None,
+    token: Token = None,
+    esi_client: object = None,
+    use_etag: bool = False,
+    raw: bool = False,
+    record_filter: Callable = None,
+) -> "ESIPages":
+    """returns all pages of a paged endpoint from ESI, which are fetched
+    while iterating over them, will retry on some HTTP errors.
+
+    Same as ``esi_fetch_stream()``, but yields the records of each page as list.
+    The consumer can stop early, e.g. once a page has no new records.
+    Remaining pages are then no longer fetched.
+
+    - use_etag: When set to True will send the ETags from the last request
+    and raise ``HTTPNotModified`` before yielding any page
+    if the data has not changed since then.
+    The new ETags are only stored once the consumer calls ``save_etags()``.
+    """
+    return ESIPages(
+        esi_path=esi_path,
+        args=args or {},
+        token=token,
+        esi_client=esi_client,
+        use_etag=use_etag,
+        raw=raw,
+        record_filter=record_filter,
+    )
+
+
+class ESIPages:
+    """Pages of a paged endpoint from ESI, which are fetched while iterating
+
+    The new ETags of all pages retrieved are kept with the object and only stored
+    by ``save_etags()``. Consumers call it once they have stored
+    what they made of the pages, so that the next request after a failure
+    fetches all pages again instead of being answered with ``HTTPNotModified``.
+
+    When the consumer stopped early only the ETags of the pages retrieved
+    are stored and only those pages are checked with the next request.
+    This requires that consumers decide when to stop from the records
+    of the pages retrieved so far only.
+    """
+
+    def __init__(
+        self,
+        esi_path: str,
+        args: dict,
+        token: Token = None,
+        esi_client: object = None,
+        use_etag: bool = False,
+        raw: bool = False,
+        record_filter: Callable = None,
+    ) -> None:
+        self.esi_path = esi_path
+        self.args = args
+        self.token = token
+        self.esi_client = esi_client
+        self.use_etag = use_etag
+        self.raw = raw
+        self.record_filter = record_filter
+        self.etags = {}
+        self.pages = 0
+
+    def __iter__(self):
+        """fetches all pages and yields them in order
+
+        When use_etag is set raises HTTPNotModified if none of the pages
+        retrieved the last time have changed since then.
+        """
+        self.etags = {}
+        self.pages = 0
+        stored = cache.get(self._etags_key) if self.use_etag else None
+        if not isinstance(stored, dict) or "etags" not in stored:
+            stored = {"pages": 0, "etags": {}}
+
+        etags = stored["etags"]
+        try:
+            response_object, headers = _fetch_with_retries(
+                esi_path=self.esi_path,
+                args=self.args,
+                has_pages=True,
+                esi_client=self.esi_client,
+                token=self.token,
+                etag=etags.get(1),
+                raw=self.raw,
+                record_filter=self.record_filter,
+            )
+        except HTTPNotModified as ex:
+            metric_tags = {"endpoint": self.esi_path}
+            if _remaining_pages_not_modified(
+                esi_path=self.esi_path,
+                args=self.args,
+                pages=_pages_from_headers(ex.response.headers),
+                etags=etags,
+                etags_pages=stored["pages"],
+                esi_client=self.esi_client,
+                raw=self.raw,
+            ):
+                metrics.incr("esi_etag_requests", tags={**metric_tags, "result": "hit"})
+                raise ex
+
+            metrics.incr("esi_etag_requests", tags={**metric_tags, "result": "miss"})
+            logger.info(f"Fetching from ESI: {self.esi_path} - Data has changed")
+            response_object, headers = _fetch_with_retries(
+                esi_path=self.esi_path,
+                args=self.args,
+                has_pages=True,
+                esi_client=self.esi_client,
+                token=self.token,
+                raw=self.raw,
+                record_filter=self.record_filter,
+            )
+
+        pages = _pages_from_headers(headers)
+        self.pages = max(pages, 1)
+        metrics.incr("esi_pages", tags={"endpoint": self.esi_path})
+        self.etags[1] = headers.get("etag")
+        yield response_object
+
+        if pages > 1:
+            # token has just been refreshed for the first page if needed
+            # and is passed on to the remaining pages as part of args
+            for page, (response_object_page, headers_page) in enumerate(
+                _fetch_pages(
+                    esi_path=self.esi_path,
+                    args=self.args,
+                    pages=pages,
+                    esi_client=self.esi_client,
+                    raw=self.raw,
+                    record_filter=self.record_filter,
+                ),
+                start=2,
+            ):
+                self.etags[page] = headers_page.get("etag")
+                yield response_object_page
+
+    def save_etags(self):
+        """stores the ETags of the pages retrieved,
+        which are sent with the next request for the same pages
+        """
+        if self.use_etag and self.etags:
+            cache.set(
+                self._etags_key,
+                {"pages": self.pages, "etags": self.etags},
+                ESI_ETAGS_CACHE_TIMEOUT,
+            )
+
+    @property
+    def _etags_key(self) -> str:
+        return _etags_cache_key(self.esi_path, self.args)
+
+
 def esi_fetch_with_localization(
     esi_path: str,
     languages: set,
@@ -128,6 +369,78 @@ def esi_fetch_with_localization(
     )
 
 
+async def esi_fetch_async(
+    esi_path: str,
+    args: dict = None,
+    has_pages: bool = False,
+    token: Token = None,
+    esi_client: object = None,
+    raw: bool = False,
+) -> dict:
+    """coroutine variant of ``esi_fetch()`` with the same arguments
+
+    The request is run in a worker thread, so that many requests can be awaited
+    at once, e.g. with ``asyncio.gather()``.
+    Make sure the token is refreshed before starting concurrent requests with it.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        _async_executor(),
+        metrics.propagate(
+            partial(
+                esi_fetch,
+                esi_path=esi_path,
+                args=dict(args) if args else None,
+                has_pages=has_pages,
+                token=token,
+                esi_client=esi_client,
+                raw=raw,
+            )
+        ),
+    )
+
+
+async def esi_fetch_with_localization_async(
+    esi_path: str,
+    languages: set,
+    args: dict = None,
+    has_pages: bool = False,
+    esi_client: object = None,
+    token: Token = None,
+) -> dict:
+    """coroutine variant of ``esi_fetch_with_localization()``
+    with the same arguments
+
+    The requests are run in a worker thread, so that many requests can be awaited
+    at once, e.g. with ``asyncio.gather()``.
+    Make sure the token is refreshed before starting concurrent requests with it.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        _async_executor(),
+        metrics.propagate(
+            partial(
+                esi_fetch_with_localization,
+                esi_path=esi_path,
+                languages=languages,
+                args=dict(args) if args else None,
+                has_pages=has_pages,
+                esi_client=esi_client,
+                token=token,
+            )
+        ),
+    )
+
+
+def esi_expires(esi_path: str, args: dict = None) -> datetime:
+    """returns when the last response for an esi request expires in the ESI cache
+    or None if unknown
+
+    Fetching the same request again before then will return the same data.
+    """
+    return cache.get(_expires_cache_key(esi_path, args or {}))
+
+
 def _fetch_main(
     esi_path: str,
     args: dict,
@@ -135,6 +448,7 @@ def _fetch_main(
     has_pages: bool,
     esi_client: object,
     token: Token,
+    raw: bool = False,
 ) -> dict:
     """returns dict of response objects from ESI with localization"""
 
@@ -147,19 +461,32 @@ def _fetch_main(
     else:
         has_localization = True
 
-    response_objects = dict()
-    for language in languages:
+    def fetch_language(language: str):
+        language_args = dict(args)
         if has_localization:
-            args["language"] = language
-        response_objects[language] = _fetch_with_paging(
+            language_args["language"] = language
+        return _fetch_with_paging(
             esi_path=esi_path,
-            args=args,
+            args=language_args,
             has_pages=has_pages,
             esi_client=esi_client,
             token=token,
+            raw=raw,
         )
 
-    return response_objects
+    languages = list(languages)
+    max_workers = min(BUYBACKS2_ESI_MAX_WORKERS, len(languages))
+    if max_workers <= 1:
+        return {language: fetch_language(language) for language in languages}
+
+    # refresh token once upfront instead of in each worker
+    if token and token.expired:
+        token.refresh()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(
+            zip(languages, executor.map(metrics.propagate(fetch_language), languages))
+        )
 
 
 def _fetch_with_paging(
@@ -168,29 +495,180 @@ def _fetch_with_paging(
     has_pages: bool = False,
     esi_client: object = None,
     token: Token = None,
+    raw: bool = False,
 ) -> dict:
     """fetches esi objects incl. all pages if requested and returns them"""
-    response_object, pages = _fetch_with_retries(
+    if not has_pages:
+        response_object, _ = _fetch_with_retries(
+            esi_path=esi_path,
+            args=args,
+            esi_client=esi_client,
+            token=token,
+            raw=raw,
+        )
+        return response_object
+
+    response_object = []
+    for response_object_page in ESIPages(
         esi_path=esi_path,
         args=args,
-        has_pages=has_pages,
         esi_client=esi_client,
         token=token,
-    )
-    if has_pages:
-        for page in range(2, pages + 1):
-            response_object_page, _ = _fetch_with_retries(
+        raw=raw,
+    ):
+        response_object += response_object_page
+
+    return response_object
+
+
+def _remaining_pages_not_modified(
+    esi_path: str,
+    args: dict,
+    pages: int,
+    etags: dict,
+    etags_pages: int,
+    esi_client: object = None,
+    raw: bool = False,
+) -> bool:
+    """checks the remaining pages retrieved the last time with their ETags
+
+    returns True if none of them has changed, else False
+    """
+    retrieved = len(etags)
+    if set(etags) != set(range(1, retrieved + 1)) or not all(etags.values()):
+        return False
+
+    if retrieved == etags_pages:
+        # all pages were retrieved, so any change in the number of pages counts
+        if max(pages, 1) != retrieved:
+            return False
+    elif pages < retrieved:
+        return False
+
+    for page in range(2, retrieved + 1):
+        try:
+            _fetch_with_retries(
                 esi_path=esi_path,
-                args=args,
-                has_pages=has_pages,
+                args=dict(args),
+                has_pages=True,
                 page=page,
                 pages=pages,
                 esi_client=esi_client,
-                token=token,
+                etag=etags[page],
+                raw=raw,
             )
-            response_object += response_object_page
+        except HTTPNotModified:
+            continue
+        else:
+            return False
+
+    return True
+
+
+def _fetch_pages(
+    esi_path: str,
+    args: dict,
+    pages: int,
+    esi_client: object = None,
+    raw: bool = False,
+    record_filter: Callable = None,
+):
+    """fetches pages 2 to pages from ESI in parallel
+
+    yields the response objects and headers of all pages
+    in order of their page number.
+    Only up to max workers pages are fetched ahead of the consumer.
+    """
+
+    def fetch_page(page: int):
+        result = _fetch_with_retries(
+            esi_path=esi_path,
+            args=dict(args),
+            has_pages=True,
+            page=page,
+            pages=pages,
+            esi_client=esi_client,
+            raw=raw,
+            record_filter=record_filter,
+        )
+        metrics.incr("esi_pages", tags={"endpoint": esi_path})
+        return result
+
+    page_numbers = range(2, pages + 1)
+    max_workers = min(BUYBACKS2_ESI_MAX_WORKERS, len(page_numbers))
+    if max_workers <= 1:
+        for page in page_numbers:
+            yield fetch_page(page)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = deque()
+        try:
+            for page in page_numbers:
+                futures.append(executor.submit(metrics.propagate(fetch_page), page))
+                if len(futures) >= max_workers:
+                    yield futures.popleft().result()
+
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            # consumer may have stopped early
+            for future in futures:
+                future.cancel()
+
+
+def _pages_from_headers(headers) -> int:
+    """returns the total number of pages as reported by ESI"""
+    if "x-pages" in headers:
+        return int(headers["x-pages"])
+
+    return 0
+
+
+def _etags_cache_key(esi_path: str, args: dict) -> str:
+    """returns the cache key for the ETags of all pages of an esi request"""
+    return f"buybacks2_esi_etags_{_request_hash(esi_path, args)}"
+
+
+def _expires_cache_key(esi_path: str, args: dict) -> str:
+    """returns the cache key for the expiry of the last response of an esi request"""
+    return f"buybacks2_esi_expires_{_request_hash(esi_path, args)}"
+
+
+def _request_hash(esi_path: str, args: dict) -> str:
+    """returns a hash identifying an esi request regardless of page and token"""
+    request_args = {
+        key: value for key, value in args.items() if key not in ("page", "token")
+    }
+    return md5(f"{esi_path}:{sorted(request_args.items())}".encode("utf-8")).hexdigest()
+
+
+def _market_api():
+    """returns the singular cached session for the Fuzzwork market API"""
+    global _my_market_api
+
+    if not _my_market_api:
+        with _init_lock:
+            if not _my_market_api:
+                from .http_cache import cached_session
+
+                _my_market_api = cached_session("market.fuzzwork.cache")
+
+    return _my_market_api
 
-    return response_object
+
+def _esi_api():
+    """returns the singular cached session for direct requests to ESI"""
+    global _my_esi_api
+
+    if not _my_esi_api:
+        with _init_lock:
+            if not _my_esi_api:
+                from .http_cache import cached_session
+
+                _my_esi_api = cached_session("esi.cache")
+
+    return _my_esi_api
 
 
 def _esi_client() -> object:
@@ -198,12 +676,31 @@ def _esi_client() -> object:
     global _my_esi_client
 
     if not _my_esi_client:
-        logger.info("Initializing esi client for esi_fetch....")
-        _my_esi_client = esi_client_factory()
+        with _init_lock:
+            if not _my_esi_client:
+                from esi.clients import esi_client_factory
+
+                logger.info("Initializing esi client for esi_fetch....")
+                _my_esi_client = esi_client_factory()
 
     return _my_esi_client
 
 
+def _async_executor() -> ThreadPoolExecutor:
+    """returns the singular thread pool for running async requests"""
+    global _my_async_executor
+
+    if not _my_async_executor:
+        with _init_lock:
+            if not _my_async_executor:
+                _my_async_executor = ThreadPoolExecutor(
+                    max_workers=BUYBACKS2_ESI_MAX_WORKERS,
+                    thread_name_prefix="buybacks2_esi",
+                )
+
+    return _my_async_executor
+
+
 def _fetch_with_retries(
     esi_path: str,
     args: dict,
@@ -212,8 +709,11 @@ def _fetch_with_retries(
     pages: int = None,
     esi_client: object = None,
     token: Token = None,
+    etag: str = None,
+    raw: bool = False,
+    record_filter: Callable = None,
 ) -> tuple:
-    """Returns response object and pages from ESI, retries on 502s"""
+    """Returns response object and response headers from ESI, retries on 502s"""
 
     esi_category, esi_method_name, log_message_base = _prepare_esi_request(
         esi_path=esi_path,
@@ -224,14 +724,18 @@ def _fetch_with_retries(
         esi_client=esi_client,
         token=token,
     )
-    response_object, pages = _execute_esi_request(
+    response_object, headers = _execute_esi_request(
+        esi_path=esi_path,
         esi_category=esi_category,
         esi_method_name=esi_method_name,
         args=args,
         has_pages=has_pages,
         log_message_base=log_message_base,
+        etag=etag,
+        raw=raw,
+        record_filter=record_filter,
     )
-    return response_object, pages
+    return response_object, headers
 
 
 def _prepare_esi_request(
@@ -274,49 +778,54 @@ def _prepare_esi_request(
 
 
 def _execute_esi_request(
+    esi_path: str,
     esi_category: str,
     esi_method_name: str,
     args: dict,
     has_pages: bool,
     log_message_base: str,
+    etag: str = None,
+    raw: bool = False,
+    record_filter: Callable = None,
 ):
     """make request to ESI
 
-    returns request object and total number of pages to retrieve
+    returns request object and headers of the response.
+    raises HTTPNotModified if an etag is given and the data has not changed.
     """
     logger.info(log_message_base)
-    pages = 0
-    response = None
+    request_args = dict(args)
+    if etag:
+        request_args["_request_options"] = {"headers": {"If-None-Match": etag}}
+
+    headers = {}
     response_object = None
+    metric_tags = {"endpoint": esi_path}
     for retry_count in range(ESI_MAX_RETRIES + 1):
         if retry_count > 0:
             logger.warning(
                 f"{log_message_base} - Retry {retry_count} / {ESI_MAX_RETRIES}"
             )
+            metrics.incr("esi_retries", tags=metric_tags)
+        _wait_for_esi_error_limit()
         try:
-            operation = getattr(esi_category, esi_method_name)(**args)
-            result_args = {}
-            if has_pages:
-                if hasattr(operation, "request_config"):
-                    operation.request_config.also_return_response = True
-                    response_object, response = operation.result(**result_args)
-                elif hasattr(operation, "also_return_response"):
-                    operation.also_return_response = True
-                    response_object, response = operation.result(**result_args)
-                else:
-                    logger.warning(
-                        "django-esi API is not fully compatible. "
-                        "Falling back to fetching first page only from ESI"
-                    )
-                    response_object = operation.result(**result_args)
-
-                if response and "x-pages" in response.headers:
-                    pages = int(response.headers["x-pages"])
-            else:
-                response_object = operation.result(**result_args)
+            with _esi_request_slot(args.get("token")), metrics.timer(
+                "esi_request_duration_seconds", metric_tags
+            ):
+                response_object, headers = _call_esi_operation(
+                    esi_category=esi_category,
+                    esi_method_name=esi_method_name,
+                    request_args=request_args,
+                    has_pages=has_pages,
+                    raw=raw,
+                    record_filter=record_filter,
+                )
+            _record_esi_response(esi_path, 200, headers)
+            _update_esi_expires(esi_path, args, headers)
             break
 
         except (HTTPBadGateway, HTTPGatewayTimeout, HTTPServiceUnavailable) as ex:
+            _record_esi_response(esi_path, ex.status_code, _headers_from_exception(ex))
             logger.warning(
                 "HTTP error while trying to "
                 "fetch response_object from ESI: {ex}".format(ex=ex)
@@ -328,4 +837,146 @@ def _execute_esi_request(
             else:
                 raise ex
 
-    return response_object, pages
+        except HTTPError as ex:
+            _record_esi_response(esi_path, ex.status_code, _headers_from_exception(ex))
+            if isinstance(ex, HTTPNotModified):
+                _update_esi_expires(esi_path, args, _headers_from_exception(ex))
+            if ex.status_code == ESI_ERROR_LIMITED_STATUS_CODE and (
+                retry_count < ESI_MAX_RETRIES
+            ):
+                logger.warning(f"{log_message_base} - ESI error limit reached")
+            else:
+                raise ex
+
+    return response_object, headers
+
+
+def _call_esi_operation(
+    esi_category: str,
+    esi_method_name: str,
+    request_args: dict,
+    has_pages: bool,
+    raw: bool = False,
+    record_filter: Callable = None,
+) -> tuple:
+    """calls the ESI operation once and returns response object and headers"""
+    headers = {}
+    operation = getattr(esi_category, esi_method_name)(**request_args)
+    result_args = {}
+    if raw and hasattr(operation, "future"):
+        # skip response validation and model building by bravado
+        incoming_response = operation.future.result()
+        if not 200 <= incoming_response.status_code < 300:
+            raise make_http_exception(response=incoming_response)
+        response_object = incoming_response.json()
+        headers = incoming_response.headers
+    elif hasattr(operation, "request_config"):
+        operation.request_config.also_return_response = True
+        response_object, response = operation.result(**result_args)
+        headers = response.headers
+    elif hasattr(operation, "also_return_response"):
+        operation.also_return_response = True
+        response_object, response = operation.result(**result_args)
+        headers = response.headers
+    else:
+        if has_pages:
+            logger.warning(
+                "django-esi API is not fully compatible. "
+                "Falling back to fetching first page only from ESI"
+            )
+        response_object = operation.result(**result_args)
+
+    if record_filter and isinstance(response_object, list):
+        # drop unwanted records right after decoding in the worker,
+        # so pages waiting to be consumed only hold the wanted ones
+        response_object = [
+            record for record in response_object if record_filter(record)
+        ]
+
+    return response_object, headers
+
+
+def _headers_from_exception(ex: HTTPError):
+    """returns the headers of the response that caused an HTTP error"""
+    response = getattr(ex, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+def _record_esi_response(esi_path: str, status_code: int, headers):
+    """records metrics and the error limit of a response from ESI"""
+    metrics.incr("esi_requests", tags={"endpoint": esi_path, "status": status_code})
+    if status_code >= 400:
+        metrics.incr("esi_errors", tags={"endpoint": esi_path, "status": status_code})
+    _update_esi_error_limit(headers)
+
+
+def _update_esi_expires(esi_path: str, args: dict, headers):
+    """stores when the first page of a response from ESI expires"""
+    if args.get("page", 1) != 1 or "expires" not in headers:
+        return
+
+    try:
+        expires = parsedate_to_datetime(headers["expires"])
+    except (TypeError, ValueError):
+        return
+
+    cache.set(_expires_cache_key(esi_path, args), expires, ESI_EXPIRES_CACHE_TIMEOUT)
+
+
+def _wait_for_esi_error_limit():
+    """waits until the ESI error limit is reset
+
+    if any worker has seen the remaining errors drop to the threshold
+    """
+    reset_at = cache.get(ESI_ERROR_LIMIT_RESET_AT_CACHE_KEY)
+    if reset_at:
+        sleep_seconds = reset_at - time()
+        if sleep_seconds > 0:
+            logger.warning(
+                f"ESI error limit almost reached. "
+                f"Waiting {sleep_seconds:.1f} seconds until it is reset"
+            )
+            sleep(sleep_seconds)
+
+
+def _update_esi_error_limit(headers):
+    """shares the ESI error limit from the response headers with all workers"""
+    if (
+        "x-esi-error-limit-remain" not in headers
+        or "x-esi-error-limit-reset" not in headers
+    ):
+        return
+
+    remain = int(headers["x-esi-error-limit-remain"])
+    reset = int(headers["x-esi-error-limit-reset"])
+    metrics.gauge("esi_error_limit_remain", remain)
+    if remain <= BUYBACKS2_ESI_ERROR_LIMIT_THRESHOLD:
+        # add one second to make sure ESI has reset the limit
+        cache.set(ESI_ERROR_LIMIT_RESET_AT_CACHE_KEY, time() + reset + 1, reset + 1)
+
+
+@contextmanager
+def _esi_request_slot(access_token: str = None):
+    """waits for one of the slots for concurrent requests with this token
+
+    The slots are shared between all workers through the cache
+    """
+    if not access_token:
+        yield
+        return
+
+    token_hash = md5(access_token.encode("utf-8")).hexdigest()
+    slot_key = None
+    while not slot_key:
+        for slot in range(BUYBACKS2_ESI_MAX_CONCURRENT_REQUESTS_PER_TOKEN):
+            key = f"buybacks2_esi_slot_{token_hash}_{slot}"
+            if cache.add(key, True, ESI_REQUEST_SLOT_TIMEOUT):
+                slot_key = key
+                break
+        else:
+            sleep(ESI_REQUEST_SLOT_SLEEP_SECS)
+
+    try:
+        yield
+    finally:
+        cache.delete(slot_key)
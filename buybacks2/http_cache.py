@@ -0,0 +1,133 @@
+"""Cache backends for the HTTP sessions used by this app"""
+import zlib
+
+from requests_cache import CachedSession
+from requests_cache.backends.base import BaseCache, BaseStorage
+from requests_cache.serializers import SerializerPipeline, Stage, pickle_serializer
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .app_settings import (
+    BUYBACKS2_HTTP_CACHE_BACKEND,
+    BUYBACKS2_HTTP_CACHE_COMPRESS,
+    BUYBACKS2_HTTP_CACHE_MAX_ENTRIES,
+    HTTP_CACHE_BACKEND_DJANGO,
+    HTTP_CACHE_BACKEND_FILESYSTEM,
+    HTTP_CACHE_BACKEND_SQLITE,
+)
+
+logger = get_extension_logger(__name__)
+
+HTTP_CACHE_EXPIRE_AFTER = 330
+
+# responses are kept longer than they are fresh, so they can be revalidated
+DJANGO_CACHE_TIMEOUT = 3600
+
+compressed_pickle_serializer = SerializerPipeline(
+    [*pickle_serializer.stages, Stage(zlib, dumps="compress", loads="decompress")],
+    name="pickle_zlib",
+    is_binary=True,
+)
+
+
+class DjangoCacheStorage(BaseStorage):
+    """Storage for requests-cache in the Django cache, e.g. Redis
+
+    The Django cache can not list its keys, so entries are not iterable
+    and are removed by the cache itself once they time out.
+    """
+
+    def __init__(self, namespace: str, timeout: int = DJANGO_CACHE_TIMEOUT, **kwargs):
+        super().__init__(**kwargs)
+        self.namespace = namespace
+        self.timeout = timeout
+
+    def _key(self, key: str) -> str:
+        return f"buybacks2_http_cache_{self.namespace}_{key}"
+
+    def __getitem__(self, key):
+        value = cache.get(self._key(key))
+        if value is None:
+            raise KeyError(key)
+
+        return self.deserialize(key, value)
+
+    def __setitem__(self, key, value):
+        cache.set(self._key(key), self.serialize(value), self.timeout)
+
+    def __delitem__(self, key):
+        if not cache.delete(self._key(key)):
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter([])
+
+    def __len__(self):
+        return 0
+
+    def clear(self):
+        """entries can not be listed and will time out on their own"""
+
+
+class DjangoCache(BaseCache):
+    """requests-cache backend using the Django cache"""
+
+    def __init__(self, cache_name: str, serializer=None, **kwargs):
+        super().__init__(cache_name=cache_name, **kwargs)
+        self.responses = DjangoCacheStorage(
+            namespace=f"{cache_name}_responses", serializer=serializer
+        )
+        self.redirects = DjangoCacheStorage(
+            namespace=f"{cache_name}_redirects", serializer=None
+        )
+
+
+def cached_session(cache_name: str) -> CachedSession:
+    """returns a new cached HTTP session with the configured cache backend"""
+    serializer = (
+        compressed_pickle_serializer
+        if BUYBACKS2_HTTP_CACHE_COMPRESS
+        else pickle_serializer
+    )
+    if BUYBACKS2_HTTP_CACHE_BACKEND == HTTP_CACHE_BACKEND_DJANGO:
+        backend = DjangoCache(cache_name, serializer=serializer)
+    elif BUYBACKS2_HTTP_CACHE_BACKEND == HTTP_CACHE_BACKEND_SQLITE:
+        backend = HTTP_CACHE_BACKEND_SQLITE
+    else:
+        backend = HTTP_CACHE_BACKEND_FILESYSTEM
+
+    return CachedSession(
+        cache_name,
+        backend=backend,
+        serializer=serializer,
+        use_cache_dir=True,
+        expire_after=HTTP_CACHE_EXPIRE_AFTER,
+        cache_control=True,
+    )
+
+
+def cleanup_session_cache(session: CachedSession):
+    """removes expired responses from the cache of a session
+    and the oldest responses exceeding the max number of entries
+
+    Responses are removed first in, first out by the time they were cached,
+    not by when they were last used.
+    """
+    session.cache.delete(expired=True)
+
+    if BUYBACKS2_HTTP_CACHE_MAX_ENTRIES:
+        responses = sorted(
+            session.cache.filter(), key=lambda response: response.created_at
+        )
+        excess = len(responses) - BUYBACKS2_HTTP_CACHE_MAX_ENTRIES
+        if excess > 0:
+            logger.info(
+                "Removing %d responses from HTTP cache %s",
+                excess,
+                session.cache.cache_name,
+            )
+            session.cache.delete(
+                *[response.cache_key for response in responses[:excess]]
+            )
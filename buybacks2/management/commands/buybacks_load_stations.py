@@ -0,0 +1,44 @@
+import bz2
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import Station
+
+STATIONS_DUMP_URL = "https://www.fuzzwork.co.uk/dump/latest/staStations.csv.bz2"
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads all NPC stations from a staStations.csv dump of the static data export,"
+        f" e.g. {STATIONS_DUMP_URL}"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "file",
+            help="Path to staStations.csv, optionally compressed as .bz2",
+        )
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        open_file = bz2.open if path.endswith(".bz2") else open
+        try:
+            with open_file(path, "rt", encoding="utf-8", newline="") as file:
+                stations = [
+                    Station(
+                        id=int(row["stationID"]),
+                        name=row["stationName"],
+                        solar_system_id=int(row["solarSystemID"]),
+                    )
+                    for row in csv.DictReader(file)
+                ]
+        except (OSError, KeyError, ValueError) as ex:
+            raise CommandError(f"Failed to read stations from {path}: {ex}")
+
+        with transaction.atomic():
+            Station.objects.all().delete()
+            Station.objects.bulk_create(stations, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f"Loaded {len(stations)} stations"))
@@ -1,15 +1,24 @@
+import asyncio
+from datetime import timedelta
+
 from bravado.exception import HTTPForbidden, HTTPUnauthorized
 
+from django.core.cache import cache
 from django.db import models
+from django.db.models import F, Q
+from django.utils.timezone import now
 
 from allianceauth.services.hooks import get_extension_logger
 from esi.models import Token
 from eveuniverse.models import EveSolarSystem
 
-from .helpers import esi_fetch
+from .helpers import esi_fetch, esi_fetch_async
 
 logger = get_extension_logger(__name__)
 
+# structures that denied access are not fetched again for this long
+LOCATION_NO_ACCESS_CACHE_TIMEOUT = 3600 * 24
+
 
 class LocationManager(models.Manager):
     STATION_ID_START = 60000000
@@ -31,20 +40,300 @@ class LocationManager(models.Manager):
 
         return location, created
 
+    def get_or_create_many_from_esi(
+        self, token: Token, location_ids: set, add_unknown: bool = True
+    ) -> dict:
+        """gets or creates location objects for all given ids
+
+        Data of all unknown locations is fetched from ESI at once
+        and the new locations are created in bulk.
+        Structures without access are left out unless add_unknown is set.
+        Returns dict of location objects by id.
+        """
+        locations = self.in_bulk(location_ids)
+        unknown_ids = [
+            location_id for location_id in location_ids if location_id not in locations
+        ]
+        if not unknown_ids:
+            return locations
+
+        fetched = self._stations_from_static_data(unknown_ids)
+        no_access_ids = self._no_access_ids(unknown_ids)
+        fetch_ids = [
+            location_id
+            for location_id in unknown_ids
+            if location_id not in no_access_ids and location_id not in fetched
+        ]
+        if fetch_ids:
+            if token and token.expired:
+                token.refresh()
+
+            results = asyncio.run(self._fetch_many_esi_async(token, fetch_ids))
+        else:
+            results = []
+
+        for location_id, result in zip(fetch_ids, results):
+            if isinstance(result, (HTTPUnauthorized, HTTPForbidden)):
+                logger.warning(f"No access to this structure: {result}")
+                self._remember_no_access(location_id)
+                no_access_ids.add(location_id)
+            elif isinstance(result, Exception):
+                logger.exception(f"Failed to load location {location_id}: {result}")
+                raise result
+            else:
+                fetched[location_id] = result
+
+        solar_systems = self._solar_systems(
+            {
+                self._solar_system_id(location_id, result)
+                for location_id, result in fetched.items()
+            }
+        )
+        new_locations = [
+            self._location_from_esi_result(
+                location_id,
+                result,
+                solar_systems[self._solar_system_id(location_id, result)],
+            )
+            for location_id, result in fetched.items()
+        ]
+        if add_unknown:
+            new_locations += [
+                self._unknown_structure(location_id) for location_id in no_access_ids
+            ]
+
+        self.bulk_create(new_locations, batch_size=500, ignore_conflicts=True)
+        locations.update({location.id: location for location in new_locations})
+        return locations
+
     def update_or_create_from_esi(
         self, token: Token, location_id: int, add_unknown: bool = True
     ) -> tuple:
-        """updates or creates location object with data fetched from ESI"""
-        from .models import Location
+        """updates or creates location object with data fetched from ESI
 
-        if location_id >= self.STATION_ID_START and location_id <= self.STATION_ID_END:
-            logger.info("Fetching station from ESI")
+        NPC stations are taken from the static data if it has been loaded
+        """
+        stations = self._stations_from_static_data([location_id])
+        if location_id in stations:
+            result = stations[location_id]
+        elif self._no_access_ids([location_id]):
+            result = None
+        else:
             try:
-                station = esi_fetch(
-                    "Universe.get_universe_stations_station_id",
-                    args={"station_id": location_id},
+                result = esi_fetch(**self._esi_request(token, location_id))
+            except Exception as ex:
+                result = ex
+
+        return self._update_or_create_from_esi_result(
+            location_id=location_id, result=result, add_unknown=add_unknown
+        )
+
+    def refresh_stale_from_esi(self, max_age: timedelta, limit: int) -> int:
+        """refreshes locations not refreshed for max_age with data from ESI,
+        longest stale first and at most limit locations
+
+        Structures are fetched with the token of a corp having an office there.
+        Returns the number of refreshed locations.
+        """
+        from .models import Office
+
+        location_ids = list(
+            self.filter(
+                Q(last_refreshed__isnull=True) | Q(last_refreshed__lt=now() - max_age)
+            )
+            .order_by(F("last_refreshed").asc(nulls_first=True))
+            .values_list("id", flat=True)[:limit]
+        )
+        if not location_ids:
+            return 0
+
+        corporations = {
+            office.location_id: office.corporation
+            for office in Office.objects.filter(
+                location_id__in=location_ids
+            ).select_related("corporation")
+        }
+        location_ids_by_corporation = {}
+        for location_id in location_ids:
+            corporation = corporations.get(location_id)
+            if corporation or self._is_station(location_id):
+                location_ids_by_corporation.setdefault(corporation, []).append(
+                    location_id
                 )
 
+        for (
+            corporation,
+            corporation_location_ids,
+        ) in location_ids_by_corporation.items():
+            token = (
+                corporation.token(["esi-universe.read_structures.v1"])[0]
+                if corporation
+                else None
+            )
+            if corporation and not token:
+                continue
+
+            if token and token.expired:
+                token.refresh()
+
+            stations = self._stations_from_static_data(corporation_location_ids)
+            no_access_ids = self._no_access_ids(corporation_location_ids)
+            fetch_ids = [
+                location_id
+                for location_id in corporation_location_ids
+                if location_id not in stations and location_id not in no_access_ids
+            ]
+            results = (
+                asyncio.run(self._fetch_many_esi_async(token, fetch_ids))
+                if fetch_ids
+                else []
+            )
+            for location_id, result in [
+                *stations.items(),
+                *zip(fetch_ids, results),
+            ]:
+                try:
+                    self._update_or_create_from_esi_result(
+                        location_id=location_id, result=result
+                    )
+                except Exception:
+                    # logged already, will be retried once stale again
+                    pass
+
+        # locations that could not be refreshed are retried once stale again
+        self.filter(id__in=location_ids).update(last_refreshed=now())
+        return len(location_ids)
+
+    def _is_station(self, location_id: int) -> bool:
+        return self.STATION_ID_START <= location_id <= self.STATION_ID_END
+
+    def _esi_request(self, token: Token, location_id: int) -> dict:
+        """returns the arguments for fetching a station or structure from ESI"""
+        if self._is_station(location_id):
+            return {
+                "esi_path": "Universe.get_universe_stations_station_id",
+                "args": {"station_id": location_id},
+            }
+
+        return {
+            "esi_path": "Universe.get_universe_structures_structure_id",
+            "args": {"structure_id": location_id},
+            "token": token,
+        }
+
+    def _stations_from_static_data(self, location_ids: list) -> dict:
+        """returns data of NPC stations found in the local static data
+        like the ESI response object by id
+        """
+        from .models import Station
+
+        station_ids = [
+            location_id for location_id in location_ids if self._is_station(location_id)
+        ]
+        if not station_ids:
+            return {}
+
+        return {
+            station.id: {"name": station.name, "system_id": station.solar_system_id}
+            for station in Station.objects.filter(id__in=station_ids)
+        }
+
+    def _no_access_ids(self, location_ids: list) -> set:
+        """returns the ids of structures which recently denied access"""
+        keys = {
+            self._no_access_cache_key(location_id): location_id
+            for location_id in location_ids
+            if not self._is_station(location_id)
+        }
+        return {keys[key] for key in cache.get_many(list(keys.keys()))}
+
+    def _remember_no_access(self, location_id: int):
+        """skips fetching a structure without access for a while"""
+        cache.set(
+            self._no_access_cache_key(location_id),
+            True,
+            LOCATION_NO_ACCESS_CACHE_TIMEOUT,
+        )
+
+    @staticmethod
+    def _no_access_cache_key(location_id: int) -> str:
+        return f"buybacks2_location_no_access_{location_id}"
+
+    def _solar_system_id(self, location_id: int, result) -> int:
+        if self._is_station(location_id):
+            return result["system_id"]
+
+        return result["solar_system_id"]
+
+    @staticmethod
+    def _solar_systems(solar_system_ids: set) -> dict:
+        """returns solar systems by id, known ones are fetched in one query"""
+        solar_systems = EveSolarSystem.objects.in_bulk(solar_system_ids)
+        for solar_system_id in solar_system_ids - solar_systems.keys():
+            solar_system, _ = EveSolarSystem.objects.get_or_create_esi(
+                id=solar_system_id
+            )
+            solar_systems[solar_system_id] = solar_system
+
+        return solar_systems
+
+    def _location_from_esi_result(
+        self, location_id: int, result, eve_solar_system: EveSolarSystem
+    ):
+        """returns a new location object from an ESI response object"""
+        from .models import Location
+
+        return self.model(
+            id=location_id,
+            name=result["name"],
+            eve_solar_system=eve_solar_system,
+            category_id=(
+                Location.CATEGORY_STATION_ID
+                if self._is_station(location_id)
+                else Location.CATEGORY_STRUCTURE_ID
+            ),
+            last_refreshed=now(),
+        )
+
+    def _unknown_structure(self, location_id: int):
+        """returns a new location object for a structure without access"""
+        from .models import Location
+
+        return self.model(
+            id=location_id,
+            name=f"Unknown structure {location_id}",
+            category_id=Location.CATEGORY_STRUCTURE_ID,
+            last_refreshed=now(),
+        )
+
+    async def _fetch_many_esi_async(self, token: Token, location_ids: list) -> list:
+        """fetches many stations and structures from ESI at once
+
+        returns response objects or exceptions in order of location_ids
+        """
+        return await asyncio.gather(
+            *[
+                esi_fetch_async(**self._esi_request(token, location_id))
+                for location_id in location_ids
+            ],
+            return_exceptions=True,
+        )
+
+    def _update_or_create_from_esi_result(
+        self, location_id: int, result, add_unknown: bool = True
+    ) -> tuple:
+        """updates or creates location object from an ESI response object
+        or the exception raised while fetching it.
+        A result of None means that access to the structure was recently denied.
+        """
+        from .models import Location
+
+        if self._is_station(location_id):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+
+                station = result
                 eve_solar_system, _ = EveSolarSystem.objects.get_or_create_esi(
                     id=station["system_id"]
                 )
@@ -55,6 +344,7 @@ class LocationManager(models.Manager):
                         "name": station["name"],
                         "eve_solar_system": eve_solar_system,
                         "category_id": Location.CATEGORY_STATION_ID,
+                        "last_refreshed": now(),
                     },
                 )
             except Exception as ex:
@@ -62,12 +352,15 @@ class LocationManager(models.Manager):
                 raise ex
         else:
             try:
-                structure = esi_fetch(
-                    "Universe.get_universe_structures_structure_id",
-                    args={"structure_id": location_id},
-                    token=token,
-                )
+                if result is None:
+                    raise self.model.DoesNotExist(
+                        f"No access to structure {location_id} for a while"
+                    )
+
+                if isinstance(result, Exception):
+                    raise result
 
+                structure = result
                 eve_solar_system, _ = EveSolarSystem.objects.get_or_create_esi(
                     id=structure["solar_system_id"]
                 )
@@ -78,16 +371,20 @@ class LocationManager(models.Manager):
                         "name": structure["name"],
                         "eve_solar_system": eve_solar_system,
                         "category_id": Location.CATEGORY_STRUCTURE_ID,
+                        "last_refreshed": now(),
                     },
                 )
-            except (HTTPUnauthorized, HTTPForbidden) as ex:
+            except (HTTPUnauthorized, HTTPForbidden, self.model.DoesNotExist) as ex:
                 logger.warning(f"No access to this structure: {ex}")
+                if not isinstance(ex, self.model.DoesNotExist):
+                    self._remember_no_access(location_id)
                 if add_unknown:
                     location, created = self.get_or_create(
                         id=location_id,
                         defaults={
                             "name": f"Unknown structure {location_id}",
                             "category_id": Location.CATEGORY_STRUCTURE_ID,
+                            "last_refreshed": now(),
                         },
                     )
                 else:
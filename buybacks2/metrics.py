@@ -0,0 +1,351 @@
+"""Instrumentation of requests to ESI and other HTTP APIs
+
+Metrics are sent to the sink configured with ``BUYBACKS2_METRICS_SINK``:
+- ``"log"``: every measurement is logged
+- ``"statsd"``: measurements are sent to statsd (requires the ``statsd`` package)
+- ``"prometheus"``: measurements are aggregated in each process and the Django cache
+  and exposed in the Prometheus text format by the metrics view
+
+Independent of the sink, counters can be collected for a block of code
+with ``collect()``, e.g. to record statistics of a sync run.
+"""
+import atexit
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from hashlib import md5
+from threading import Lock
+from time import monotonic, perf_counter
+
+from django.core.cache import cache
+
+from allianceauth.services.hooks import get_extension_logger
+
+from .app_settings import (
+    BUYBACKS2_METRICS_SINK,
+    BUYBACKS2_METRICS_STATSD_HOST,
+    BUYBACKS2_METRICS_STATSD_PORT,
+)
+
+logger = get_extension_logger(__name__)
+
+METRICS_PREFIX = "buybacks2"
+METRICS_SINK_LOG = "log"
+METRICS_SINK_PROMETHEUS = "prometheus"
+METRICS_SINK_STATSD = "statsd"
+
+HISTOGRAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PROMETHEUS_CACHE_TIMEOUT = 3600 * 24 * 7
+PROMETHEUS_FLUSH_INTERVAL_SECONDS = 10
+PROMETHEUS_SLOTS_COUNT_CACHE_KEY = "buybacks2_metrics_slots_count"
+
+_my_sink = None
+_collectors = ContextVar("buybacks2_metrics_collectors", default=())
+
+
+def incr(name: str, value: int = 1, tags: dict = None):
+    """increments the counter ``name`` by value"""
+    for collector in _collectors.get():
+        collector.incr(name, value, tags or {})
+
+    sink = _sink()
+    if sink:
+        sink.incr(name, value, tags or {})
+
+
+def gauge(name: str, value: float, tags: dict = None):
+    """sets the gauge ``name`` to value"""
+    sink = _sink()
+    if sink:
+        sink.gauge(name, value, tags or {})
+
+
+def observe(name: str, value: float, tags: dict = None):
+    """records value in the histogram ``name``"""
+    sink = _sink()
+    if sink:
+        sink.observe(name, value, tags or {})
+
+
+@contextmanager
+def timer(name: str, tags: dict = None):
+    """records the duration of the block in seconds in the histogram ``name``"""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, perf_counter() - start, tags)
+
+
+@contextmanager
+def collect():
+    """collects all counters incremented in the block, incl. by threads
+    started with ``propagate()``, and yields the collector
+    """
+    collector = Collector()
+    token = _collectors.set(_collectors.get() + (collector,))
+    try:
+        yield collector
+    finally:
+        _collectors.reset(token)
+
+
+def propagate(func):
+    """returns func wrapped to collect counters for the collectors
+    of the calling thread, e.g. when running func in a thread pool
+    """
+    collectors = _collectors.get()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _collectors.set(collectors)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _collectors.reset(token)
+
+    return wrapper
+
+
+def prometheus_text() -> str:
+    """returns all aggregated metrics in the Prometheus text format"""
+    if not isinstance(_sink(), PrometheusSink):
+        return ""
+
+    return _sink().render()
+
+
+def flush():
+    """writes measurements aggregated in this process to the cache,
+    e.g. at the end of a task
+    """
+    sink = _sink()
+    if isinstance(sink, PrometheusSink):
+        sink.flush()
+
+
+class Collector:
+    """sums up counters by name and tags"""
+
+    def __init__(self):
+        self._counters = Counter()
+        self._lock = Lock()
+
+    def incr(self, name: str, value: int, tags: dict):
+        with self._lock:
+            self._counters[(name, tuple(sorted(tags.items())))] += value
+
+    def total(self, name: str, **tags) -> int:
+        """returns the sum of the counter name for all series matching tags"""
+        with self._lock:
+            return sum(
+                value
+                for (counter_name, counter_tags), value in self._counters.items()
+                if counter_name == name
+                and all(dict(counter_tags).get(key) == tags[key] for key in tags)
+            )
+
+
+class LogSink:
+    """logs all measurements"""
+
+    def incr(self, name: str, value: int, tags: dict):
+        logger.info("metric %s %s +%s", name, tags, value)
+
+    def gauge(self, name: str, value: float, tags: dict):
+        logger.info("metric %s %s =%s", name, tags, value)
+
+    def observe(self, name: str, value: float, tags: dict):
+        logger.info("metric %s %s %.3f", name, tags, value)
+
+
+class StatsdSink:
+    """sends all measurements to statsd"""
+
+    def __init__(self):
+        from statsd import StatsClient
+
+        self.client = StatsClient(
+            BUYBACKS2_METRICS_STATSD_HOST,
+            BUYBACKS2_METRICS_STATSD_PORT,
+            prefix=METRICS_PREFIX,
+        )
+
+    @staticmethod
+    def _stat(name: str, tags: dict) -> str:
+        return ".".join([name] + [str(tags[key]) for key in sorted(tags)])
+
+    def incr(self, name: str, value: int, tags: dict):
+        self.client.incr(self._stat(name, tags), value)
+
+    def gauge(self, name: str, value: float, tags: dict):
+        self.client.gauge(self._stat(name, tags), value)
+
+    def observe(self, name: str, value: float, tags: dict):
+        self.client.timing(self._stat(name, tags), value * 1000)
+
+
+class PrometheusSink:
+    """aggregates all measurements in the Django cache, so that measurements
+    of all workers can be exposed by the web process
+
+    Measurements are first aggregated in each process and written to the cache
+    at most every few seconds. Each series is registered once in its own slot,
+    from which the registry of all series is rebuilt on render.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._series = {}
+        self._counters = Counter()
+        self._gauges = {}
+        self._last_flush = monotonic()
+        atexit.register(self.flush)
+
+    def incr(self, name: str, value: int, tags: dict):
+        with self._lock:
+            self._counters[
+                self._series_key("counter", name, f"{name}_total", tags)
+            ] += value
+        self._flush_if_due()
+
+    def gauge(self, name: str, value: float, tags: dict):
+        with self._lock:
+            self._gauges[self._series_key("gauge", name, name, tags)] = value
+        self._flush_if_due()
+
+    def observe(self, name: str, value: float, tags: dict):
+        with self._lock:
+            # every bucket is kept, so that all series of a histogram
+            # exist from its first measurement on
+            for bucket in HISTOGRAM_BUCKETS + ("+Inf",):
+                bucket_tags = {**tags, "le": bucket}
+                self._counters[
+                    self._series_key("histogram", name, f"{name}_bucket", bucket_tags)
+                ] += (1 if bucket == "+Inf" or value <= bucket else 0)
+            # the cache can only increment integers, so the sum is kept in ms
+            self._counters[
+                self._series_key("histogram", name, f"{name}_sum_ms", tags)
+            ] += round(value * 1000)
+            self._counters[
+                self._series_key("histogram", name, f"{name}_count", tags)
+            ] += 1
+        self._flush_if_due()
+
+    def flush(self):
+        """writes the measurements aggregated since the last flush to the cache"""
+        with self._lock:
+            counters, self._counters = self._counters, Counter()
+            gauges, self._gauges = self._gauges, {}
+            self._last_flush = monotonic()
+            series = {key: self._series[key] for key in [*counters, *gauges]}
+
+        if not series:
+            return
+
+        self._register(series)
+        for key, value in counters.items():
+            if value:
+                self._incr(key, value)
+            else:
+                cache.add(key, 0, PROMETHEUS_CACHE_TIMEOUT)
+        if gauges:
+            cache.set_many(gauges, PROMETHEUS_CACHE_TIMEOUT)
+
+    def render(self) -> str:
+        self.flush()
+        slots_count = cache.get(PROMETHEUS_SLOTS_COUNT_CACHE_KEY, 0)
+        slots = cache.get_many(
+            [self._slot_key(slot) for slot in range(1, slots_count + 1)]
+        )
+        registry = {key: series for key, *series in slots.values()}
+        values = cache.get_many(list(registry.keys()))
+        lines = []
+        family_types = {}
+        for key, (metric_type, family, name, tags) in sorted(
+            registry.items(),
+            key=lambda item: (item[1][2], str(sorted(item[1][3].items()))),
+        ):
+            if key not in values:
+                continue
+
+            if family not in family_types:
+                family_types[family] = metric_type
+                lines.append(f"# TYPE {METRICS_PREFIX}_{family} {metric_type}")
+
+            value = values[key]
+            if name.endswith("_sum_ms"):
+                name = name[: -len("_ms")]
+                value = value / 1000
+
+            labels = ",".join(f'{label}="{tags[label]}"' for label in sorted(tags))
+            lines.append(f"{METRICS_PREFIX}_{name}{{{labels}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def _flush_if_due(self):
+        if monotonic() - self._last_flush >= PROMETHEUS_FLUSH_INTERVAL_SECONDS:
+            self.flush()
+
+    def _series_key(self, metric_type: str, family: str, name: str, tags: dict) -> str:
+        """returns the cache key of a series and remembers the series"""
+        series = f"{name}:{sorted(tags.items())}"
+        key = f"buybacks2_metrics_{md5(series.encode('utf-8')).hexdigest()}"
+        if key not in self._series:
+            self._series[key] = (metric_type, family, name, tags)
+
+        return key
+
+    def _register(self, series: dict):
+        """registers all series that are not registered yet in a new slot
+
+        Only the first worker to add the marker of a series registers it,
+        which happens again once the marker has timed out or was evicted.
+        """
+        markers = {f"{key}_registered": key for key in series}
+        registered = cache.get_many(list(markers.keys()))
+        for marker, key in markers.items():
+            if marker in registered or not cache.add(
+                marker, True, PROMETHEUS_CACHE_TIMEOUT
+            ):
+                continue
+
+            slot = self._incr(PROMETHEUS_SLOTS_COUNT_CACHE_KEY, timeout=None)
+            cache.set(
+                self._slot_key(slot), (key, *series[key]), PROMETHEUS_CACHE_TIMEOUT
+            )
+
+    @staticmethod
+    def _slot_key(slot: int) -> str:
+        return f"buybacks2_metrics_slot_{slot}"
+
+    @staticmethod
+    def _incr(key: str, value: int = 1, timeout: int = PROMETHEUS_CACHE_TIMEOUT) -> int:
+        cache.add(key, 0, timeout)
+        try:
+            return cache.incr(key, value)
+        except ValueError:
+            # key has just timed out
+            cache.set(key, value, timeout)
+            return value
+
+
+def _sink():
+    """returns the singular metrics sink or None if metrics are disabled"""
+    global _my_sink
+
+    if _my_sink is None and BUYBACKS2_METRICS_SINK:
+        if BUYBACKS2_METRICS_SINK == METRICS_SINK_LOG:
+            _my_sink = LogSink()
+        elif BUYBACKS2_METRICS_SINK == METRICS_SINK_STATSD:
+            try:
+                _my_sink = StatsdSink()
+            except ImportError:
+                logger.warning("statsd is not installed. Metrics will not be recorded")
+                _my_sink = False
+        elif BUYBACKS2_METRICS_SINK == METRICS_SINK_PROMETHEUS:
+            _my_sink = PrometheusSink()
+
+    return _my_sink or None
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("buybacks2", "0003_contracts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="corporation",
+            name="contracts_watermark_id",
+            field=models.PositiveBigIntegerField(
+                default=0,
+                help_text="All contracts up to this ID are completed and have been synced",
+            ),
+        ),
+        migrations.AddField(
+            model_name="corporation",
+            name="contracts_watermark_date",
+            field=models.DateTimeField(
+                blank=True,
+                default=None,
+                help_text="Issue date of the contract at the watermark",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("buybacks2", "0004_corporation_contracts_watermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContractItem",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "contract_id",
+                    models.PositiveBigIntegerField(
+                        db_index=True,
+                        help_text="Eve Online ID of the contract",
+                    ),
+                ),
+                ("type_id", models.PositiveIntegerField()),
+                ("quantity", models.PositiveBigIntegerField()),
+                ("is_included", models.BooleanField()),
+            ],
+            options={
+                "default_permissions": (),
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+import json
+from hashlib import md5
+
+from django.db import migrations, models
+
+
+def items_signature(quantities: dict) -> str:
+    pairs = sorted(
+        (int(type_id), int(quantity))
+        for type_id, quantity in quantities.items()
+        if int(quantity)
+    )
+    return md5(
+        ",".join(f"{type_id}:{quantity}" for type_id, quantity in pairs).encode("utf-8")
+    ).hexdigest()
+
+
+def forwards(apps, schema_editor):
+    Notification = apps.get_model("buybacks2", "Notification")
+    notifications = list(Notification.objects.all())
+    for notification in notifications:
+        notification.items_signature = items_signature(json.loads(notification.items))
+
+    Notification.objects.bulk_update(notifications, ["items_signature"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("buybacks2", "0005_contractitem"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="items_signature",
+            field=models.CharField(
+                db_index=True,
+                default="",
+                help_text="Signature of items for matching them with contracts",
+                max_length=32,
+            ),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations, models
+
+
+def reset_contracts_watermark(apps, schema_editor):
+    """contracts below the watermark need to be fetched again to be stored"""
+    Corporation = apps.get_model("buybacks2", "Corporation")
+    Corporation.objects.update(contracts_watermark_id=0, contracts_watermark_date=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("buybacks2", "0006_notification_items_signature"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RawContract",
+            fields=[
+                (
+                    "id",
+                    models.PositiveBigIntegerField(
+                        help_text="Eve Online ID of the contract",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "issuer_id",
+                    models.PositiveIntegerField(
+                        help_text="Eve Online ID of the character who issued the contract"
+                    ),
+                ),
+                ("start_location_id", models.PositiveBigIntegerField()),
+                ("price", models.FloatField()),
+                ("status", models.CharField(max_length=32)),
+                ("date_issued", models.DateTimeField()),
+                ("date_expired", models.DateTimeField()),
+                (
+                    "corporation",
+                    models.ForeignKey(
+                        on_delete=models.deletion.CASCADE,
+                        related_name="+",
+                        to="buybacks2.corporation",
+                    ),
+                ),
+            ],
+            options={
+                "default_permissions": (),
+            },
+        ),
+        migrations.RunPython(reset_contracts_watermark, migrations.RunPython.noop),
+    ]
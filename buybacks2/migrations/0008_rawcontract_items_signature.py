@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("buybacks2", "0007_rawcontract"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rawcontract",
+            name="items_signature",
+            field=models.CharField(
+                default="",
+                help_text="Signature of included items, empty while unknown",
+                max_length=32,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rawcontract",
+            index=models.Index(
+                fields=["corporation", "status", "start_location_id", "issuer_id"],
+                name="buybacks2_rawcontract_match",
+            ),
+        ),
+    ]
@@ -0,0 +1,78 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("buybacks2", "0008_rawcontract_items_signature"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncRun",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("contracts", "Contracts sync"),
+                            ("matching", "Contracts matching"),
+                            ("offices", "Offices update"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("started_at", models.DateTimeField(db_index=True)),
+                (
+                    "finished_at",
+                    models.DateTimeField(blank=True, default=None, null=True),
+                ),
+                ("success", models.BooleanField(default=False)),
+                (
+                    "error",
+                    models.TextField(
+                        blank=True,
+                        default="",
+                        help_text="Exception which made the run fail",
+                    ),
+                ),
+                (
+                    "pages",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Pages fetched from ESI"
+                    ),
+                ),
+                ("contracts_scanned", models.PositiveIntegerField(default=0)),
+                ("matches", models.PositiveIntegerField(default=0)),
+                ("db_queries", models.PositiveIntegerField(default=0)),
+                ("esi_errors", models.PositiveIntegerField(default=0)),
+                (
+                    "cache_hits",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Requests answered by ETags or the HTTP cache",
+                    ),
+                ),
+                (
+                    "corporation",
+                    models.ForeignKey(
+                        on_delete=models.deletion.CASCADE,
+                        related_name="+",
+                        to="buybacks2.corporation",
+                    ),
+                ),
+            ],
+            options={
+                "default_permissions": (),
+            },
+        ),
+    ]
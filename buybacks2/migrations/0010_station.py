@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("buybacks2", "0009_syncrun"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Station",
+            fields=[
+                (
+                    "id",
+                    models.PositiveBigIntegerField(
+                        help_text="Eve Online ID of the station",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                (
+                    "solar_system_id",
+                    models.PositiveIntegerField(
+                        help_text="Eve Online ID of the solar system"
+                    ),
+                ),
+            ],
+            options={
+                "default_permissions": (),
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("buybacks2", "0010_station"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="last_refreshed",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                default=None,
+                help_text="When this location was last updated from ESI",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def remove_contract_items(apps, schema_editor):
+    """removes stored items, which may contain duplicates without a record ID.
+    They are fetched again from ESI when needed.
+    """
+    ContractItem = apps.get_model("buybacks2", "ContractItem")
+    ContractItem.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("buybacks2", "0011_location_last_refreshed"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_contract_items, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="contractitem",
+            name="record_id",
+            field=models.PositiveBigIntegerField(
+                default=0,
+                help_text="Eve Online ID of the item within the contract",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AlterUniqueTogether(
+            name="contractitem",
+            unique_together={("contract_id", "record_id")},
+        ),
+    ]
@@ -1,8 +1,16 @@
+import asyncio
 import json
+from contextlib import contextmanager
+from datetime import timedelta
 from typing import Tuple
 
+from bravado.exception import HTTPNotModified
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from allianceauth.authentication.models import CharacterOwnership
 from allianceauth.eveonline.models import EveCorporationInfo
@@ -11,13 +19,56 @@ from esi.errors import TokenExpiredError, TokenInvalidError
 from esi.models import Token
 from eveuniverse.models import EveSolarSystem, EveType
 
-from .helpers import esi_fetch
+from . import metrics
+from .app_settings import BUYBACKS2_CONTRACTS_IDLE_SYNC_HOURS
+from .helpers import (
+    esi_expires,
+    esi_fetch_async,
+    esi_fetch_pages,
+)
 from .managers import LocationManager
+from .utils import items_signature
 from .validators import validate_brokerage
 
 logger = get_extension_logger(__name__)
 
 OFFICE_TYPE_ID = 27
+ASSETS_ESI_PATH = "Assets.get_corporations_corporation_id_assets"
+CONTRACTS_ESI_PATH = "Contracts.get_corporations_corporation_id_contracts"
+# ESI only returns contracts of the last 30 days
+RAW_CONTRACTS_MAX_AGE_DAYS = 30
+CONTRACTS_MATCH_BATCH_SIZE = 100
+CONTRACTS_SIGNING_CLAIM_TIMEOUT = 600
+
+
+def _select_for_update(manager: models.Manager) -> models.QuerySet:
+    """returns a queryset locking its rows until the end of the transaction
+    and skipping rows locked by other workers if the database supports it
+    """
+    return manager.select_for_update(
+        skip_locked=connection.features.has_select_for_update_skip_locked
+    )
+
+
+@contextmanager
+def _signing_claims(contract_ids: list):
+    """claims contracts for fetching their items from ESI across all workers
+    and yields the IDs of the contracts claimed,
+    skipping the ones already claimed by other workers
+    """
+    keys = {
+        contract_id: f"buybacks2_contract_signing_{contract_id}"
+        for contract_id in contract_ids
+    }
+    claimed_ids = [
+        contract_id
+        for contract_id, key in keys.items()
+        if cache.add(key, True, CONTRACTS_SIGNING_CLAIM_TIMEOUT)
+    ]
+    try:
+        yield claimed_ids
+    finally:
+        cache.delete_many([keys[contract_id] for contract_id in claimed_ids])
 
 
 class Buybacks(models.Model):
@@ -61,93 +112,479 @@ class Corporation(models.Model):
         related_name="+",
     )
 
+    contracts_watermark_id = models.PositiveBigIntegerField(
+        default=0,
+        help_text="All contracts up to this ID are completed and have been synced",
+    )
+    contracts_watermark_date = models.DateTimeField(
+        blank=True,
+        default=None,
+        null=True,
+        help_text="Issue date of the contract at the watermark",
+    )
+
     class Meta:
         default_permissions = ()
 
-    def sync_contracts_esi(self):
+    def contracts_sync_due(self) -> bool:
+        """returns True if the contracts of this corp should be synced now
+
+        Contracts are synced once the last contracts from ESI have expired
+        while users are waiting for their notifications to be matched.
+        Without notifications contracts are still synced every few hours,
+        so that contracts finished before their notification was created
+        are stored and can be matched right away.
+        """
+        if not Notification.objects.filter(
+            program_location__office__corporation=self
+        ).exists():
+            return not SyncRun.objects.filter(
+                corporation=self,
+                kind=SyncRun.KIND_CONTRACTS,
+                started_at__gt=timezone.now()
+                - timedelta(hours=BUYBACKS2_CONTRACTS_IDLE_SYNC_HOURS),
+            ).exists()
+
+        expires = esi_expires(
+            CONTRACTS_ESI_PATH,
+            args={"corporation_id": self.corporation.corporation_id},
+        )
+        return expires is None or expires <= timezone.now()
+
+    def sync_contracts_esi(self) -> bool:
+        """fetches new and changed buyback contracts of this corp from ESI
+        and stores them for matching
+
+        returns True if contracts have changed since the last sync
+        """
         token = self.token(
             [
                 "esi-contracts.read_corporation_contracts.v1",
             ]
         )[0]
 
-        contracts = esi_fetch(
-            "Contracts.get_corporations_corporation_id_contracts",
+        contract_pages = esi_fetch_pages(
+            CONTRACTS_ESI_PATH,
             args={
                 "corporation_id": self.corporation.corporation_id,
             },
-            has_pages=True,
             token=token,
+            use_etag=bool(self.contracts_watermark_id),
+            raw=True,
         )
 
-        buybacks = [
-            x
-            for x in contracts
-            if x["type"] == "item_exchange"
-            and x["status"] == "finished"
-            and int(x["assignee_id"]) == self.corporation.corporation_id
-        ]
-
-        for contract in buybacks:
-            notification = Notification.objects.filter(
-                program_location__office__location__id=contract["start_location_id"],
-                total=contract["price"],
-                user__character_ownerships__character__character_id=contract[
-                    "issuer_id"
+        try:
+            buybacks, watermark_id, watermark_date = self._scan_contracts(
+                contract_pages
+            )
+        except HTTPNotModified:
+            logger.info("%s: Contracts have not changed since last sync", self)
+            return False
+
+        with transaction.atomic():
+            self._store_raw_contracts(buybacks)
+            self.contracts_watermark_id = watermark_id
+            self.contracts_watermark_date = watermark_date
+            self.save(
+                update_fields=["contracts_watermark_id", "contracts_watermark_date"]
+            )
+            transaction.on_commit(contract_pages.save_etags)
+
+        return True
+
+    def _scan_contracts(self, contract_pages) -> tuple:
+        """returns new buyback contracts from all pages of contracts
+        and the new watermark.
+
+        All contracts at or below the watermark are completed and have been
+        processed before. They are skipped and paging stops at the first page
+        with only contracts issued before the watermark.
+        """
+        corporation_id = self.corporation.corporation_id
+        now = timezone.now()
+        buybacks = []
+        latest = None
+        oldest_open = None
+        for page in contract_pages:
+            if self.contracts_watermark_date and all(
+                parse_datetime(contract["date_issued"]) < self.contracts_watermark_date
+                for contract in page
+            ):
+                break
+
+            metrics.incr("contracts_scanned", len(page))
+            for contract in page:
+                contract_id = contract["contract_id"]
+                if contract_id <= self.contracts_watermark_id:
+                    continue
+
+                if latest is None or contract_id > latest["contract_id"]:
+                    latest = contract
+
+                if (
+                    contract["type"] != "item_exchange"
+                    or int(contract["assignee_id"]) != corporation_id
+                ):
+                    continue
+
+                buybacks.append(contract)
+                if contract["status"] in Contract.ESI_OPEN_STATUSES and (
+                    parse_datetime(contract["date_expired"]) > now
+                ):
+                    if oldest_open is None or contract_id < oldest_open["contract_id"]:
+                        oldest_open = contract
+
+        if oldest_open is not None:
+            # open contracts need to be checked again on the next sync
+            watermark_id = oldest_open["contract_id"] - 1
+            watermark_date = parse_datetime(oldest_open["date_issued"])
+        elif latest is not None:
+            watermark_id = latest["contract_id"]
+            watermark_date = parse_datetime(latest["date_issued"])
+        else:
+            watermark_id = self.contracts_watermark_id
+            watermark_date = self.contracts_watermark_date
+
+        return buybacks, watermark_id, watermark_date
+
+    def _store_raw_contracts(self, buybacks: list):
+        """creates or updates the raw contracts from ESI in bulk"""
+        raw_contracts = {
+            contract["contract_id"]: RawContract(
+                id=contract["contract_id"],
+                corporation=self,
+                issuer_id=contract["issuer_id"],
+                start_location_id=contract["start_location_id"],
+                price=contract["price"],
+                status=contract["status"],
+                date_issued=parse_datetime(contract["date_issued"]),
+                date_expired=parse_datetime(contract["date_expired"]),
+            )
+            for contract in buybacks
+        }
+        known_ids = set(
+            RawContract.objects.filter(id__in=raw_contracts.keys()).values_list(
+                "id", flat=True
+            )
+        )
+        with transaction.atomic():
+            RawContract.objects.bulk_create(
+                [
+                    raw_contract
+                    for contract_id, raw_contract in raw_contracts.items()
+                    if contract_id not in known_ids
                 ],
-            ).first()
+                batch_size=500,
+                ignore_conflicts=True,
+            )
+            RawContract.objects.bulk_update(
+                [raw_contracts[contract_id] for contract_id in known_ids],
+                ["status", "date_expired"],
+                batch_size=500,
+            )
+
+    def contracts_matching_due(self) -> bool:
+        """returns True if stored finished contracts of this corp are waiting
+        to be matched with open notifications, e.g. after a failed matching run
+        """
+        return (
+            RawContract.objects.filter(
+                corporation=self, status=RawContract.STATUS_FINISHED
+            )
+            .exclude(id__in=Contract.objects.values("id"))
+            .exists()
+            and Notification.objects.filter(
+                program_location__office__corporation=self
+            ).exists()
+        )
+
+    def match_contracts(self):
+        """matches the stored finished contracts of this corp
+        with the notifications of its users
+
+        Can run in several workers at once: each worker claims batches of
+        contracts with row locks, skipping the ones claimed by other workers.
+        The items of new contracts are fetched from ESI before a batch is claimed,
+        so that no locks are held while waiting for ESI. Each contract is only
+        fetched by the worker that first claimed it for signing.
+        """
+        self._prune_raw_contracts()
+        last_contract_id = 0
+        while True:
+            contract_ids = list(
+                RawContract.objects.filter(
+                    corporation=self,
+                    status=RawContract.STATUS_FINISHED,
+                    id__gt=last_contract_id,
+                )
+                .exclude(id__in=Contract.objects.values("id"))
+                .order_by("id")
+                .values_list("id", flat=True)[:CONTRACTS_MATCH_BATCH_SIZE]
+            )
+            if not contract_ids:
+                return
+
+            last_contract_id = contract_ids[-1]
+            unsigned_ids = RawContract.objects.filter(
+                id__in=contract_ids, items_signature=""
+            ).values_list("id", flat=True)
+            with _signing_claims(list(unsigned_ids)) as claimed_ids:
+                self._sign_raw_contracts(
+                    list(
+                        RawContract.objects.filter(
+                            id__in=claimed_ids, items_signature=""
+                        )
+                    )
+                )
 
+            # contracts still being signed by other workers
+            # are matched by those workers right after
+            with transaction.atomic():
+                buybacks = list(
+                    _select_for_update(RawContract.objects)
+                    .filter(id__in=contract_ids)
+                    .exclude(items_signature="")
+                    .exclude(id__in=Contract.objects.values("id"))
+                    .order_by("id")
+                )
+                if buybacks:
+                    self._match_contracts_batch(buybacks)
+
+    def _match_contracts_batch(self, buybacks: list):
+        """matches a batch of claimed contracts with notifications"""
+        notifications, ownerships = self._notifications_index(buybacks)
+        matched_notification_ids = set()
+        matches = []
+        for contract in buybacks:
+            notification = next(
+                (
+                    notification
+                    for notification in notifications.get(
+                        (
+                            contract.start_location_id,
+                            contract.price,
+                            contract.issuer_id,
+                            contract.items_signature,
+                        ),
+                        [],
+                    )
+                    if notification.id not in matched_notification_ids
+                ),
+                None,
+            )
             if notification is not None:
-                items = esi_fetch(
+                matched_notification_ids.add(notification.id)
+                matches.append((contract, notification, ownerships[contract.issuer_id]))
+
+        self.apply_contract_matches(matches)
+
+    def _prune_raw_contracts(self):
+        """removes stored contracts which are too old to be matched"""
+        contract_ids = list(
+            RawContract.objects.filter(
+                corporation=self,
+                date_issued__lt=timezone.now()
+                - timedelta(days=RAW_CONTRACTS_MAX_AGE_DAYS),
+            ).values_list("id", flat=True)
+        )
+        if contract_ids:
+            with transaction.atomic():
+                ContractItem.objects.filter(contract_id__in=contract_ids).delete()
+                RawContract.objects.filter(id__in=contract_ids).delete()
+
+    def _sign_raw_contracts(self, raw_contracts: list):
+        """stores the items signature of finished contracts,
+        so they can be matched with notifications without calling ESI
+        """
+        if not raw_contracts:
+            return
+
+        token = self.token(
+            [
+                "esi-contracts.read_corporation_contracts.v1",
+            ]
+        )[0]
+        contracts_items, new_items = self._contracts_items(
+            [contract.id for contract in raw_contracts], token
+        )
+        for contract, items in zip(raw_contracts, contracts_items):
+            quantities = {}
+
+            for item in items:
+                if item["is_included"]:
+                    type_id = int(item["type_id"])
+                    quantity = int(item["quantity"])
+
+                    if type_id in quantities:
+                        quantities[type_id] += quantity
+                    else:
+                        quantities[type_id] = quantity
+
+            contract.items_signature = items_signature(quantities)
+
+        # items and signatures are stored together,
+        # so that a signature is never computed from partially stored items
+        with transaction.atomic():
+            ContractItem.objects.bulk_create(
+                new_items, batch_size=500, ignore_conflicts=True
+            )
+            RawContract.objects.bulk_update(
+                raw_contracts, ["items_signature"], batch_size=500
+            )
+
+    def apply_contract_matches(self, matches: list):
+        """records matched contracts and removes their notifications
+        in one transaction
+
+        matches: list of tuples of raw contract, notification and
+        character ownership of the issuer
+        """
+        if not matches:
+            return
+
+        new_contracts = [
+            Contract(
+                id=contract.id,
+                program=notification.program_location.program,
+                character=character,
+                total=int(contract.price),
+                date=contract.date_issued,
+            )
+            for contract, notification, character in matches
+        ]
+        matched_contract_ids = [contract.id for contract in new_contracts]
+        metrics.incr("contract_matches", len(new_contracts))
+        with transaction.atomic():
+            Contract.objects.bulk_create(new_contracts, ignore_conflicts=True)
+            Notification.objects.filter(
+                pk__in=[notification.id for _, notification, _ in matches]
+            ).delete()
+            ContractItem.objects.filter(contract_id__in=matched_contract_ids).delete()
+            RawContract.objects.filter(id__in=matched_contract_ids).delete()
+
+    def _notifications_index(self, buybacks: list) -> Tuple[dict, dict]:
+        """returns the notifications for this corporation which may match
+        the given contracts indexed by location ID, total, character ID of the
+        user's characters and items signature and the character ownerships
+        of those users by character ID
+
+        The notifications are claimed with row locks. Notifications claimed
+        by other workers are waited for in order of their IDs instead of
+        being skipped, since they may still be left unmatched by them.
+        """
+        candidate_ids = Notification.objects.filter(
+            program_location__office__corporation=self,
+            program_location__office__location_id__in={
+                contract.start_location_id for contract in buybacks
+            },
+            total__in={int(contract.price) for contract in buybacks},
+        ).values_list("id", flat=True)
+        # notifications are locked without joins,
+        # so that related rows are not locked too
+        claimed_ids = list(
+            Notification.objects.select_for_update()
+            .filter(id__in=list(candidate_ids))
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        notifications = list(
+            Notification.objects.filter(id__in=claimed_ids)
+            .select_related("program_location__program", "program_location__office")
+            .order_by("pk")
+        )
+        ownerships = CharacterOwnership.objects.filter(
+            user_id__in={notification.user_id for notification in notifications}
+        ).select_related("character")
+
+        character_ids_by_user = {}
+        ownerships_by_character = {}
+        for ownership in ownerships:
+            character_id = ownership.character.character_id
+            character_ids_by_user.setdefault(ownership.user_id, []).append(character_id)
+            ownerships_by_character[character_id] = ownership
+
+        notifications_index = {}
+        for notification in notifications:
+            location_id = notification.program_location.office.location_id
+            for character_id in character_ids_by_user.get(notification.user_id, []):
+                notifications_index.setdefault(
+                    (
+                        location_id,
+                        notification.total,
+                        character_id,
+                        notification.items_signature,
+                    ),
+                    [],
+                ).append(notification)
+
+        return notifications_index, ownerships_by_character
+
+    def _contracts_items(self, contract_ids: list, token: Token) -> Tuple[list, list]:
+        """returns the items of many contracts in order of contract_ids
+        and the items newly fetched from ESI, which are to be stored by the caller
+
+        Items are fetched from ESI only once and stored for later syncs
+        """
+        items_by_contract = {}
+        for item in ContractItem.objects.filter(contract_id__in=contract_ids).values(
+            "contract_id", "type_id", "quantity", "is_included"
+        ):
+            items_by_contract.setdefault(item["contract_id"], []).append(item)
+
+        missing_ids = [
+            contract_id
+            for contract_id in contract_ids
+            if contract_id not in items_by_contract
+        ]
+        new_items = []
+        if missing_ids:
+            if token.expired:
+                token.refresh()
+
+            fetched_items = asyncio.run(
+                self._fetch_contracts_items_async(missing_ids, token)
+            )
+            for contract_id, items in zip(missing_ids, fetched_items):
+                items_by_contract[contract_id] = items
+                new_items += [
+                    ContractItem(
+                        contract_id=contract_id,
+                        record_id=item["record_id"],
+                        type_id=item["type_id"],
+                        quantity=item["quantity"],
+                        is_included=item["is_included"],
+                    )
+                    for item in items
+                ]
+
+        return [
+            items_by_contract[contract_id] for contract_id in contract_ids
+        ], new_items
+
+    async def _fetch_contracts_items_async(self, contract_ids: list, token: Token):
+        """fetches the items of many contracts from ESI at once"""
+        return await asyncio.gather(
+            *[
+                esi_fetch_async(
                     "Contracts.get_corporations_corporation_id_contracts_contract_id_items",
                     args={
                         "corporation_id": self.corporation.corporation_id,
-                        "contract_id": contract["contract_id"],
+                        "contract_id": contract_id,
                     },
                     token=token,
+                    raw=True,
                 )
+                for contract_id in contract_ids
+            ]
+        )
 
-                quantities = {}
-
-                for item in items:
-                    if item["is_included"]:
-                        type_id = int(item["type_id"])
-                        quantity = int(item["quantity"])
-
-                        if type_id in quantities:
-                            quantities[type_id] += quantity
-                        else:
-                            quantities[type_id] = quantity
-
-                data = json.loads(notification.items)
-                match = True
-
-                for type_id in data:
-                    type_id = int(type_id)
-
-                    if (
-                        type_id not in quantities
-                        or quantities[type_id] != data[str(type_id)]
-                    ):
-                        match = False
-
-                if match:
-                    character = CharacterOwnership.objects.filter(
-                        character__character_id=contract["issuer_id"]
-                    ).first()
-
-                    if character is not None:
-                        Notification.objects.filter(
-                            pk=notification.id,
-                        ).delete()
-
-                        Contract.objects.create(
-                            id=contract["contract_id"],
-                            program=notification.program_location.program,
-                            character=character,
-                            total=contract["price"],
-                            date=contract["date_issued"],
-                        )
+    def offices_update_due(self) -> bool:
+        """returns True once the last assets from ESI have expired"""
+        expires = esi_expires(
+            ASSETS_ESI_PATH,
+            args={"corporation_id": self.corporation.corporation_id},
+        )
+        return expires is None or expires <= timezone.now()
 
     def update_offices_esi(self):
         token = self.token(
@@ -157,39 +594,56 @@ class Corporation(models.Model):
             ]
         )[0]
 
-        assets = esi_fetch(
-            "Assets.get_corporations_corporation_id_assets",
+        asset_pages = esi_fetch_pages(
+            ASSETS_ESI_PATH,
             args={
                 "corporation_id": self.corporation.corporation_id,
             },
-            has_pages=True,
             token=token,
+            use_etag=True,
+            raw=True,
+            record_filter=lambda asset: asset["type_id"] == OFFICE_TYPE_ID,
         )
 
-        office_ids_to_remove = list(
-            Office.objects.filter(corporation=self).values_list("id", flat=True)
-        )
+        try:
+            offices = [asset for page in asset_pages for asset in page]
+        except HTTPNotModified:
+            logger.info("%s: Offices have not changed since last update", self)
+            return
 
-        for asset in assets:
-            if asset["type_id"] == OFFICE_TYPE_ID:
-                location = Location.objects.get_or_create_from_esi(
-                    location_id=asset["location_id"],
-                    token=token,
-                )[0]
+        self._update_offices(offices, token)
+        asset_pages.save_etags()
+
+    def _update_offices(self, offices: list, token: Token):
+        locations = Location.objects.get_or_create_many_from_esi(
+            token=token,
+            location_ids={asset["location_id"] for asset in offices},
+        )
 
-                office_id = asset["item_id"]
-                office = Office.objects.filter(pk=office_id).first()
+        office_location_ids = {
+            asset["item_id"]: asset["location_id"] for asset in offices
+        }
+        known_office_ids = set(
+            Office.objects.filter(corporation=self).values_list("id", flat=True)
+        )
 
-                if office is not None:
-                    office_ids_to_remove.remove(office.id)
-                else:
-                    Office.objects.create(
+        with transaction.atomic():
+            Office.objects.bulk_create(
+                [
+                    Office(
                         id=office_id,
                         corporation=self,
-                        location=location,
+                        location=locations[location_id],
                     )
-
-        Office.objects.filter(pk__in=office_ids_to_remove).delete()
+                    for office_id, location_id in office_location_ids.items()
+                    if office_id not in known_office_ids
+                ],
+                batch_size=500,
+                ignore_conflicts=True,
+            )
+            Office.objects.filter(
+                pk__in=known_office_ids - office_location_ids.keys()
+            ).delete()
 
     def token(self, scopes=None) -> Tuple[Token, int]:
         """returns a valid Token for the character"""
@@ -255,6 +709,13 @@ class Location(models.Model):
         choices=CATEGORY_CHOICES,
         default=CATEGORY_UNKNOWN_ID,
     )
+    last_refreshed = models.DateTimeField(
+        blank=True,
+        db_index=True,
+        default=None,
+        null=True,
+        help_text="When this location was last updated from ESI",
+    )
 
     objects = LocationManager()
 
@@ -280,6 +741,27 @@ class Location(models.Model):
         return self.name.rsplit("-", 1)[1].strip()
 
 
+class Station(models.Model):
+    """An Eve Online NPC station loaded from the static data export"""
+
+    id = models.PositiveBigIntegerField(
+        primary_key=True,
+        help_text="Eve Online ID of the station",
+    )
+    name = models.CharField(
+        max_length=100,
+    )
+    solar_system_id = models.PositiveIntegerField(
+        help_text="Eve Online ID of the solar system",
+    )
+
+    class Meta:
+        default_permissions = ()
+
+    def __str__(self):
+        return self.name
+
+
 class Office(models.Model):
     """An Eve Online buyback office for a corp: station or Upwell structure"""
 
@@ -408,14 +890,67 @@ class Notification(models.Model):
     items = models.TextField(
         help_text="JSON dump of item data",
     )
+    items_signature = models.CharField(
+        max_length=32,
+        db_index=True,
+        default="",
+        help_text="Signature of items for matching them with contracts",
+    )
 
     class Meta:
         default_permissions = ()
 
+    def save(self, *args, **kwargs):
+        self.items_signature = items_signature(json.loads(self.items))
+        super().save(*args, **kwargs)
+
+    def match_contract(self) -> bool:
+        """matches this notification with a stored finished contract
+        without calling ESI
+
+        returns True if a matching contract was found
+        """
+        office = self.program_location.office
+        ownerships = {
+            ownership.character.character_id: ownership
+            for ownership in CharacterOwnership.objects.filter(
+                user_id=self.user_id
+            ).select_related("character")
+        }
+        with transaction.atomic():
+            if not _select_for_update(Notification.objects).filter(pk=self.pk).exists():
+                # already matched or claimed by another worker
+                return False
+
+            contract = (
+                _select_for_update(RawContract.objects)
+                .filter(
+                    corporation_id=office.corporation_id,
+                    status=RawContract.STATUS_FINISHED,
+                    start_location_id=office.location_id,
+                    price=self.total,
+                    issuer_id__in=ownerships.keys(),
+                    items_signature=self.items_signature,
+                )
+                .exclude(id__in=Contract.objects.values("id"))
+                .order_by("date_issued")
+                .first()
+            )
+            if contract is None:
+                return False
+
+            office.corporation.apply_contract_matches(
+                [(contract, self, ownerships[contract.issuer_id])]
+            )
+
+        return True
+
 
 class Contract(models.Model):
     """Contract that is accepted in the buyback program"""
 
+    ESI_OPEN_STATUSES = ["outstanding", "in_progress"]
+
     id = models.PositiveBigIntegerField(
         primary_key=True,
     )
@@ -436,3 +971,166 @@ class Contract(models.Model):
 
     class Meta:
         default_permissions = ()
+
+
+class ContractItem(models.Model):
+    """Item of a finished contract as fetched from ESI"""
+
+    id = models.AutoField(
+        auto_created=True,
+        primary_key=True,
+        verbose_name="ID",
+    )
+    contract_id = models.PositiveBigIntegerField(
+        db_index=True,
+        help_text="Eve Online ID of the contract",
+    )
+    record_id = models.PositiveBigIntegerField(
+        help_text="Eve Online ID of the item within the contract",
+    )
+    type_id = models.PositiveIntegerField()
+    quantity = models.PositiveBigIntegerField()
+    is_included = models.BooleanField()
+
+    class Meta:
+        default_permissions = ()
+        unique_together = ["contract_id", "record_id"]
+
+
+class RawContract(models.Model):
+    """Buyback contract of a corp as fetched from ESI, waiting to be matched"""
+
+    STATUS_FINISHED = "finished"
+
+    id = models.PositiveBigIntegerField(
+        primary_key=True,
+        help_text="Eve Online ID of the contract",
+    )
+    corporation = models.ForeignKey(
+        Corporation,
+        on_delete=models.deletion.CASCADE,
+        related_name="+",
+    )
+    issuer_id = models.PositiveIntegerField(
+        help_text="Eve Online ID of the character who issued the contract",
+    )
+    start_location_id = models.PositiveBigIntegerField()
+    price = models.FloatField()
+    status = models.CharField(max_length=32)
+    date_issued = models.DateTimeField()
+    date_expired = models.DateTimeField()
+    items_signature = models.CharField(
+        max_length=32,
+        default="",
+        help_text="Signature of included items, empty while unknown",
+    )
+
+    class Meta:
+        default_permissions = ()
+        indexes = [
+            models.Index(
+                fields=["corporation", "status", "start_location_id", "issuer_id"],
+                name="buybacks2_rawcontract_match",
+            )
+        ]
+
+
+class SyncRun(models.Model):
+    """Statistics of one run of a sync task for a corp"""
+
+    KIND_CONTRACTS = "contracts"
+    KIND_MATCHING = "matching"
+    KIND_OFFICES = "offices"
+
+    KINDS_LIST = [
+        (KIND_CONTRACTS, "Contracts sync"),
+        (KIND_MATCHING, "Contracts matching"),
+        (KIND_OFFICES, "Offices update"),
+    ]
+
+    id = models.AutoField(
+        auto_created=True,
+        primary_key=True,
+        verbose_name="ID",
+    )
+    corporation = models.ForeignKey(
+        Corporation,
+        on_delete=models.deletion.CASCADE,
+        related_name="+",
+    )
+    kind = models.CharField(
+        max_length=16,
+        choices=KINDS_LIST,
+    )
+    started_at = models.DateTimeField(db_index=True)
+    finished_at = models.DateTimeField(
+        blank=True,
+        default=None,
+        null=True,
+    )
+    success = models.BooleanField(default=False)
+    error = models.TextField(
+        blank=True,
+        default="",
+        help_text="Exception which made the run fail",
+    )
+    pages = models.PositiveIntegerField(
+        default=0,
+        help_text="Pages fetched from ESI",
+    )
+    contracts_scanned = models.PositiveIntegerField(default=0)
+    matches = models.PositiveIntegerField(default=0)
+    db_queries = models.PositiveIntegerField(default=0)
+    esi_errors = models.PositiveIntegerField(default=0)
+    cache_hits = models.PositiveIntegerField(
+        default=0,
+        help_text="Requests answered by ETags or the HTTP cache",
+    )
+
+    class Meta:
+        default_permissions = ()
+
+    def __str__(self):
+        return f"{self.corporation} - {self.get_kind_display()} - {self.started_at}"
+
+    @property
+    def duration(self):
+        if self.finished_at is None:
+            return None
+
+        return self.finished_at - self.started_at
+
+    @classmethod
+    @contextmanager
+    def record(cls, corporation: Corporation, kind: str):
+        """records statistics of the sync run in the block"""
+        sync_run = cls(corporation=corporation, kind=kind, started_at=timezone.now())
+        db_queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal db_queries
+            db_queries += 1
+            return execute(sql, params, many, context)
+
+        try:
+            with metrics.collect() as collector, connection.execute_wrapper(
+                count_queries
+            ):
+                yield sync_run
+
+            sync_run.success = True
+        except Exception as ex:
+            sync_run.error = repr(ex)
+            raise ex
+        finally:
+            sync_run.finished_at = timezone.now()
+            sync_run.pages = collector.total("esi_pages")
+            sync_run.contracts_scanned = collector.total("contracts_scanned")
+            sync_run.matches = collector.total("contract_matches")
+            sync_run.esi_errors = collector.total("esi_errors")
+            sync_run.cache_hits = collector.total(
+                "esi_etag_requests", result="hit"
+            ) + collector.total("http_cache_requests", result="hit")
+            sync_run.db_queries = db_queries
+            sync_run.save()
+            metrics.flush()
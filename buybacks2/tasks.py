@@ -1,10 +1,23 @@
+from datetime import timedelta
+from random import randint
+
 from bravado.exception import HTTPBadGateway, HTTPGatewayTimeout, HTTPServiceUnavailable
 from celery import shared_task
 
+from django.utils.timezone import now
+
 from allianceauth.services.hooks import get_extension_logger
 from allianceauth.services.tasks import QueueOnce
 
-from .models import Corporation
+from .app_settings import (
+    BUYBACKS2_CONTRACTS_MATCH_WORKERS,
+    BUYBACKS2_LOCATIONS_REFRESH_DAYS,
+    BUYBACKS2_LOCATIONS_REFRESH_LIMIT,
+    BUYBACKS2_SYNC_RUNS_RETENTION_DAYS,
+    BUYBACKS2_TASKS_JITTER_SECONDS,
+)
+from .helpers import cleanup_http_caches
+from .models import Corporation, Location, Notification, SyncRun
 
 DEFAULT_TASK_PRIORITY = 6
 TASKS_TIME_LIMIT = 7200
@@ -43,16 +56,21 @@ TASK_ESI_KWARGS = {
 )
 def update_offices_for_corp(self, corp_pk):
     """fetches all office locations for corp from ESI"""
-    return _get_corp(corp_pk).update_offices_esi()
+    corp = _get_corp(corp_pk)
+    with SyncRun.record(corp, SyncRun.KIND_OFFICES):
+        corp.update_offices_esi()
 
 
 @shared_task(**TASK_DEFAULT_KWARGS)
 def update_all_offices():
-    for corp in Corporation.objects.all():
-        update_offices_for_corp.apply_async(
-            kwargs={"corp_pk": corp.pk},
-            priority=DEFAULT_TASK_PRIORITY,
-        )
+    """updates offices of all corps whose assets have expired in ESI"""
+    for corp in Corporation.objects.select_related("corporation"):
+        if corp.offices_update_due():
+            update_offices_for_corp.apply_async(
+                kwargs={"corp_pk": corp.pk},
+                priority=DEFAULT_TASK_PRIORITY,
+                countdown=_jitter(),
+            )
 
 
 @shared_task(
@@ -66,23 +84,111 @@ def update_all_offices():
     }
 )
 def sync_contracts_for_corp(self, corp_pk):
-    """fetches all contracts for corp from ESI"""
-    return _get_corp(corp_pk).sync_contracts_esi()
+    """fetches all contracts for corp from ESI and matches stored contracts
+    when contracts have changed or are still waiting to be matched
+    """
+    corp = _get_corp(corp_pk)
+    with SyncRun.record(corp, SyncRun.KIND_CONTRACTS):
+        has_changed = corp.sync_contracts_esi()
+
+    if has_changed or corp.contracts_matching_due():
+        for worker in range(BUYBACKS2_CONTRACTS_MATCH_WORKERS):
+            match_contracts_for_corp.apply_async(
+                kwargs={"corp_pk": corp_pk, "worker": worker},
+                priority=DEFAULT_TASK_PRIORITY,
+            )
+
+
+@shared_task(
+    **{
+        **TASK_ESI_KWARGS,
+        **{
+            "base": QueueOnce,
+            "once": {"keys": ["corp_pk", "worker"], "graceful": True},
+            "max_retries": None,
+        },
+    }
+)
+def match_contracts_for_corp(self, corp_pk, worker=0):
+    """matches stored contracts of corp with notifications
+
+    Several workers can match the contracts of the same corp in parallel
+    """
+    corp = _get_corp(corp_pk)
+    with SyncRun.record(corp, SyncRun.KIND_MATCHING):
+        corp.match_contracts()
 
 
 @shared_task(**TASK_DEFAULT_KWARGS)
 def sync_all_contracts():
-    for corp in Corporation.objects.all():
-        sync_contracts_for_corp.apply_async(
-            kwargs={"corp_pk": corp.pk},
-            priority=DEFAULT_TASK_PRIORITY,
-        )
+    """syncs contracts of all corps with open notifications
+    whose contracts have expired in ESI and of idle corps every few hours
+    """
+    for corp in Corporation.objects.select_related("corporation"):
+        if corp.contracts_sync_due():
+            sync_contracts_for_corp.apply_async(
+                kwargs={"corp_pk": corp.pk},
+                priority=DEFAULT_TASK_PRIORITY,
+                countdown=_jitter(),
+            )
+
+
+@shared_task(**TASK_DEFAULT_KWARGS)
+def match_notification(notification_pk):
+    """matches a new notification with stored contracts without calling ESI"""
+    try:
+        notification = Notification.objects.select_related(
+            "program_location__office__corporation"
+        ).get(pk=notification_pk)
+    except Notification.DoesNotExist:
+        logger.info("Notification %s has already been matched", notification_pk)
+        return
+
+    notification.match_contract()
+
+
+@shared_task(**TASK_DEFAULT_KWARGS)
+def cleanup_http_cache():
+    """removes expired and excess responses from the HTTP caches"""
+    cleanup_http_caches()
+
+
+@shared_task(
+    **{
+        **TASK_ESI_KWARGS,
+        **{
+            "base": QueueOnce,
+            "once": {"graceful": True},
+        },
+    }
+)
+def refresh_stale_locations(self):
+    """refreshes a limited number of locations with outdated names from ESI"""
+    refreshed = Location.objects.refresh_stale_from_esi(
+        max_age=timedelta(days=BUYBACKS2_LOCATIONS_REFRESH_DAYS),
+        limit=BUYBACKS2_LOCATIONS_REFRESH_LIMIT,
+    )
+    logger.info("Refreshed %d locations", refreshed)
+
+
+@shared_task(**TASK_DEFAULT_KWARGS)
+def cleanup_sync_runs():
+    """removes statistics of sync runs older than the retention period"""
+    deleted, _ = SyncRun.objects.filter(
+        started_at__lt=now() - timedelta(days=BUYBACKS2_SYNC_RUNS_RETENTION_DAYS)
+    ).delete()
+    logger.info("Removed %d sync runs", deleted)
+
+
+def _jitter() -> int:
+    """returns a random delay in seconds for spreading tasks of all corps"""
+    return randint(0, BUYBACKS2_TASKS_JITTER_SECONDS)
 
 
 def _get_corp(corp_pk: int) -> Corporation:
     """returns the corp or raises exception"""
     try:
-        corp = Corporation.objects.get(pk=corp_pk)
+        corp = Corporation.objects.select_related("corporation").get(pk=corp_pk)
     except Corporation.DoesNotExist:
         raise Corporation.DoesNotExist(
             f"Requested corp with pk {corp_pk} does not exist"
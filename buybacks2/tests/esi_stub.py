@@ -0,0 +1,238 @@
+"""Stub of ESI for tests
+
+Serves a minimal swagger spec and the data of a few endpoints from memory
+over HTTP on localhost, so that requests go through bravado
+the same way as against ESI, incl. paging, ETags and errors.
+"""
+import json
+import re
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlparse
+
+from bravado.client import SwaggerClient
+
+CONTRACTS_PATH = "/corporations/{corporation_id}/contracts/"
+CONTRACT_ITEMS_PATH = "/corporations/{corporation_id}/contracts/{contract_id}/items/"
+TYPE_PATH = "/universe/types/{type_id}/"
+ASSETS_PATH = "/corporations/{corporation_id}/assets/"
+ARRAY_SCHEMA = {"type": "array", "items": {"type": "object"}}
+CONTRACTS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "acceptor_id": {"type": "integer", "format": "int32"},
+            "assignee_id": {"type": "integer", "format": "int32"},
+            "availability": {
+                "type": "string",
+                "enum": ["public", "personal", "corporation", "alliance"],
+            },
+            "buyout": {"type": "number", "format": "double"},
+            "collateral": {"type": "number", "format": "double"},
+            "contract_id": {"type": "integer", "format": "int32"},
+            "date_accepted": {"type": "string", "format": "date-time"},
+            "date_completed": {"type": "string", "format": "date-time"},
+            "date_expired": {"type": "string", "format": "date-time"},
+            "date_issued": {"type": "string", "format": "date-time"},
+            "days_to_complete": {"type": "integer", "format": "int32"},
+            "end_location_id": {"type": "integer", "format": "int64"},
+            "for_corporation": {"type": "boolean"},
+            "issuer_corporation_id": {"type": "integer", "format": "int32"},
+            "issuer_id": {"type": "integer", "format": "int32"},
+            "price": {"type": "number", "format": "double"},
+            "reward": {"type": "number", "format": "double"},
+            "start_location_id": {"type": "integer", "format": "int64"},
+            "status": {"type": "string"},
+            "title": {"type": "string"},
+            "type": {"type": "string"},
+            "volume": {"type": "number", "format": "double"},
+        },
+    },
+}
+
+
+def _operation(
+    tag: str, operation_id: str, path_params: list, has_pages: bool, schema: dict
+):
+    parameters = [
+        {"name": name, "in": "path", "required": True, "type": "integer"}
+        for name in path_params
+    ]
+    if has_pages:
+        parameters.append({"name": "page", "in": "query", "type": "integer"})
+    parameters.append({"name": "token", "in": "query", "type": "string"})
+    return {
+        "get": {
+            "tags": [tag],
+            "operationId": operation_id,
+            "parameters": parameters,
+            "responses": {
+                "200": {
+                    "description": "OK",
+                    "schema": schema,
+                },
+                "304": {"description": "Not modified"},
+            },
+        }
+    }
+
+
+SPEC = {
+    "swagger": "2.0",
+    "info": {"title": "ESI stub", "version": "1"},
+    "basePath": "/",
+    "schemes": ["http"],
+    "produces": ["application/json"],
+    "paths": {
+        CONTRACTS_PATH: _operation(
+            "Contracts",
+            "get_corporations_corporation_id_contracts",
+            ["corporation_id"],
+            has_pages=True,
+            schema=CONTRACTS_SCHEMA,
+        ),
+        CONTRACT_ITEMS_PATH: _operation(
+            "Contracts",
+            "get_corporations_corporation_id_contracts_contract_id_items",
+            ["corporation_id", "contract_id"],
+            has_pages=False,
+            schema=ARRAY_SCHEMA,
+        ),
+        ASSETS_PATH: _operation(
+            "Assets",
+            "get_corporations_corporation_id_assets",
+            ["corporation_id"],
+            has_pages=True,
+            schema=ARRAY_SCHEMA,
+        ),
+        TYPE_PATH: _operation(
+            "Universe",
+            "get_universe_types_type_id",
+            ["type_id"],
+            has_pages=False,
+            schema={"type": "object"},
+        ),
+    },
+}
+
+
+class StubESI:
+    """ESI stub server running in a background thread
+
+    - contracts: pages of contracts, e.g. ``[[{...}, {...}], [{...}]]``
+    - assets: pages of assets
+    - contract_items: items by contract ID
+    - types: type objects by type ID
+    - failures: status codes to answer first for a page, e.g. ``{1: [502]}``
+    - requests: page and If-None-Match header of every request to contracts
+    """
+
+    def __init__(self):
+        self.contracts = []
+        self.assets = []
+        self.contract_items = {}
+        self.types = {}
+        self.failures = {}
+        self.requests = []
+        self._lock = Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubESI":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def client(self) -> SwaggerClient:
+        """returns a bravado client for this server"""
+        return SwaggerClient.from_url(
+            f"{self.url}/swagger.json", config={"use_models": False}
+        )
+
+    def contract_requests(self, page: int = None) -> list:
+        """returns the If-None-Match headers of all requests for contracts"""
+        with self._lock:
+            return [
+                etag
+                for request_page, etag in self.requests
+                if page is None or request_page == page
+            ]
+
+    def _respond(self, path: str, query: dict, headers) -> tuple:
+        """returns status code, headers and body for a request"""
+        if path == "/swagger.json":
+            return 200, {}, dict(SPEC, host=self.url.split("//")[1])
+
+        match = re.fullmatch(r"/corporations/\d+/contracts/(\d+)/items/", path)
+        if match:
+            return 200, {}, self.contract_items.get(int(match.group(1)), [])
+
+        match = re.fullmatch(r"/universe/types/(\d+)/", path)
+        if match:
+            type_id = int(match.group(1))
+            if type_id not in self.types:
+                return 404, {}, {"error": "Type not found"}
+            return 200, {}, self.types[type_id]
+
+        page = int(query.get("page", ["1"])[0])
+        if re.fullmatch(r"/corporations/\d+/assets/", path):
+            return self._respond_page(self.assets, page, headers)
+
+        if not re.fullmatch(r"/corporations/\d+/contracts/", path):
+            return 404, {}, {"error": "Not found"}
+
+        with self._lock:
+            self.requests.append((page, headers.get("If-None-Match")))
+            failures = self.failures.get(page)
+            if failures:
+                return failures.pop(0), {}, {"error": "Stub failure"}
+
+        return self._respond_page(self.contracts, page, headers)
+
+    @staticmethod
+    def _respond_page(pages_data: list, page: int, headers) -> tuple:
+        """returns status code, headers and body for a page of pages_data"""
+        pages = max(len(pages_data), 1)
+        if page > pages:
+            return 404, {}, {"error": "Page not found"}
+
+        data = pages_data[page - 1] if pages_data else []
+        etag = '"%s"' % md5(json.dumps(data).encode("utf-8")).hexdigest()
+        response_headers = {"ETag": etag, "X-Pages": str(pages)}
+        if headers.get("If-None-Match") == etag:
+            return 304, response_headers, None
+
+        return 200, response_headers, data
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, headers, data = stub._respond(
+                    url.path, parse_qs(url.query), self.headers
+                )
+                body = json.dumps(data).encode("utf-8") if data is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
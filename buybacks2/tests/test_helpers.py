@@ -0,0 +1,235 @@
+import asyncio
+from unittest.mock import patch
+
+from bravado.exception import HTTPBadGateway, HTTPNotModified
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from .. import metrics
+from ..helpers import esi_fetch, esi_fetch_async, esi_fetch_pages
+from .esi_stub import StubESI
+
+CONTRACTS_ESI_PATH = "Contracts.get_corporations_corporation_id_contracts"
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+def contract_pages(pages: int, per_page: int = 3) -> list:
+    return [
+        [{"contract_id": page * 100 + num} for num in range(per_page)]
+        for page in range(1, pages + 1)
+    ]
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@patch("buybacks2.helpers.ESI_RETRY_SLEEP_SECS", 0)
+class EsiTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.esi = StubESI().start()
+        cls.esi_client = cls.esi.client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.esi.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.esi.contracts = []
+        self.esi.contract_items = {}
+        self.esi.types = {}
+        self.esi.failures = {}
+        self.esi.requests = []
+
+    def fetch_pages(self, **kwargs):
+        return esi_fetch_pages(
+            CONTRACTS_ESI_PATH,
+            args={"corporation_id": 2001},
+            esi_client=self.esi_client,
+            **kwargs,
+        )
+
+
+class TestEsiFetch(EsiTestCase):
+    def test_should_return_all_pages_in_order(self):
+        self.esi.contracts = contract_pages(5)
+
+        for raw in (False, True):
+            with self.subTest(raw=raw):
+                result = esi_fetch(
+                    CONTRACTS_ESI_PATH,
+                    args={"corporation_id": 2001},
+                    has_pages=True,
+                    esi_client=self.esi_client,
+                    raw=raw,
+                )
+                self.assertEqual(
+                    [contract["contract_id"] for contract in result],
+                    [
+                        contract["contract_id"]
+                        for page in contract_pages(5)
+                        for contract in page
+                    ],
+                )
+
+    def test_should_retry_on_bad_gateway(self):
+        self.esi.contracts = contract_pages(2)
+        self.esi.failures = {1: [502, 502], 2: [503]}
+
+        with metrics.collect() as collector:
+            result = esi_fetch(
+                CONTRACTS_ESI_PATH,
+                args={"corporation_id": 2001},
+                has_pages=True,
+                esi_client=self.esi_client,
+                raw=True,
+            )
+
+        self.assertEqual(len(result), 6)
+        self.assertEqual(collector.total("esi_errors"), 3)
+        self.assertEqual(collector.total("esi_pages"), 2)
+
+    def test_should_give_up_after_max_retries(self):
+        self.esi.contracts = contract_pages(1)
+        self.esi.failures = {1: [502] * 4}
+
+        with self.assertRaises(HTTPBadGateway):
+            esi_fetch(
+                CONTRACTS_ESI_PATH,
+                args={"corporation_id": 2001},
+                has_pages=True,
+                esi_client=self.esi_client,
+                raw=True,
+            )
+
+        self.assertEqual(len(self.esi.contract_requests(page=1)), 4)
+
+
+class TestEsiFetchAsync(EsiTestCase):
+    def test_should_fetch_many_requests_at_once(self):
+        self.esi.contract_items = {
+            contract_id: [{"type_id": contract_id, "quantity": 1}]
+            for contract_id in range(1, 11)
+        }
+
+        async def fetch_all():
+            return await asyncio.gather(
+                *[
+                    esi_fetch_async(
+                        "Contracts.get_corporations_corporation_id_contracts_contract_id_items",
+                        args={"corporation_id": 2001, "contract_id": contract_id},
+                        esi_client=self.esi_client,
+                        raw=True,
+                    )
+                    for contract_id in range(1, 11)
+                ]
+            )
+
+        result = asyncio.run(fetch_all())
+
+        self.assertEqual(
+            result,
+            [[{"type_id": contract_id, "quantity": 1}] for contract_id in range(1, 11)],
+        )
+
+    def test_should_raise_errors_of_single_requests(self):
+        self.esi.types = {34: {"type_id": 34, "name": "Tritanium"}}
+
+        async def fetch_all():
+            return await asyncio.gather(
+                *[
+                    esi_fetch_async(
+                        "Universe.get_universe_types_type_id",
+                        args={"type_id": type_id},
+                        esi_client=self.esi_client,
+                    )
+                    for type_id in (34, 35)
+                ],
+                return_exceptions=True,
+            )
+
+        found, missing = asyncio.run(fetch_all())
+
+        self.assertEqual(found, {"type_id": 34, "name": "Tritanium"})
+        self.assertEqual(missing.status_code, 404)
+
+
+class TestEsiFetchPages(EsiTestCase):
+    def test_should_fetch_remaining_pages_only_while_consumed(self):
+        self.esi.contracts = contract_pages(20)
+
+        with metrics.collect() as collector:
+            for page in self.fetch_pages(raw=True):
+                break
+
+        self.assertEqual(page, contract_pages(20)[0])
+        # pages fetched ahead by the workers are counted, but not all 20
+        self.assertLess(collector.total("esi_pages"), 20)
+        self.assertEqual(
+            collector.total("esi_pages"), len(self.esi.contract_requests())
+        )
+
+    def test_should_raise_not_modified_after_etags_are_saved(self):
+        self.esi.contracts = contract_pages(3)
+        pages = self.fetch_pages(use_etag=True, raw=True)
+        self.assertEqual(list(pages), contract_pages(3))
+        pages.save_etags()
+
+        with metrics.collect() as collector:
+            with self.assertRaises(HTTPNotModified):
+                list(self.fetch_pages(use_etag=True, raw=True))
+
+        self.assertEqual(collector.total("esi_etag_requests", result="hit"), 1)
+        self.assertEqual(collector.total("esi_pages"), 0)
+
+    def test_should_fetch_again_when_etags_were_not_saved(self):
+        self.esi.contracts = contract_pages(3)
+        list(self.fetch_pages(use_etag=True, raw=True))
+
+        self.assertEqual(
+            list(self.fetch_pages(use_etag=True, raw=True)), contract_pages(3)
+        )
+        self.assertEqual(self.esi.contract_requests(page=1), [None, None])
+
+    def test_should_fetch_all_pages_when_one_has_changed(self):
+        self.esi.contracts = contract_pages(3)
+        pages = self.fetch_pages(use_etag=True, raw=True)
+        list(pages)
+        pages.save_etags()
+        self.esi.contracts[2] = [{"contract_id": 999}]
+
+        self.assertEqual(
+            list(self.fetch_pages(use_etag=True, raw=True)), self.esi.contracts
+        )
+
+    def test_should_fetch_all_pages_when_a_page_was_added(self):
+        self.esi.contracts = contract_pages(3)
+        pages = self.fetch_pages(use_etag=True, raw=True)
+        list(pages)
+        pages.save_etags()
+        self.esi.contracts = contract_pages(4)
+
+        self.assertEqual(
+            list(self.fetch_pages(use_etag=True, raw=True)), contract_pages(4)
+        )
+
+    def test_should_only_check_pages_retrieved_when_stopped_early(self):
+        self.esi.contracts = contract_pages(4)
+        pages = self.fetch_pages(use_etag=True, raw=True)
+        for num, page in enumerate(pages, start=1):
+            if num == 2:
+                break
+        pages.save_etags()
+        self.esi.contracts[3] = [{"contract_id": 999}]
+
+        with self.assertRaises(HTTPNotModified):
+            list(self.fetch_pages(use_etag=True, raw=True))
+
+        self.esi.contracts[1] = [{"contract_id": 998}]
+        self.assertEqual(
+            list(self.fetch_pages(use_etag=True, raw=True)), self.esi.contracts
+        )
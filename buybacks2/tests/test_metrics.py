@@ -0,0 +1,66 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from ..metrics import PrometheusSink
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestPrometheusSink(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_should_aggregate_in_process_until_flushed(self):
+        sink = PrometheusSink()
+        with patch("buybacks2.metrics.cache") as mock_cache:
+            for _ in range(100):
+                sink.incr("esi_requests", 1, {"status": 200})
+                sink.observe("esi_request_duration_seconds", 0.2, {})
+
+        self.assertFalse(mock_cache.method_calls)
+
+        sink.flush()
+        text = sink.render()
+
+        self.assertIn('buybacks2_esi_requests_total{status="200"} 100', text)
+        self.assertIn(
+            'buybacks2_esi_request_duration_seconds_bucket{le="0.25"} 100', text
+        )
+        self.assertIn('buybacks2_esi_request_duration_seconds_bucket{le="0.1"} 0', text)
+        self.assertIn("buybacks2_esi_request_duration_seconds_sum{} 20.0", text)
+        self.assertIn("buybacks2_esi_request_duration_seconds_count{} 100", text)
+
+    def test_should_render_series_of_all_workers(self):
+        workers = [PrometheusSink() for _ in range(3)]
+        for num, sink in enumerate(workers):
+            sink.incr("esi_requests", 1, {"status": 200})
+            sink.incr("esi_requests", 1, {"status": 500 + num})
+            sink.gauge("esi_error_limit_remain", 100 - num, {})
+            sink.flush()
+
+        text = workers[0].render()
+
+        self.assertIn('buybacks2_esi_requests_total{status="200"} 3', text)
+        for num in range(3):
+            self.assertIn(
+                f'buybacks2_esi_requests_total{{status="{500 + num}"}} 1', text
+            )
+        self.assertIn("buybacks2_esi_error_limit_remain{} 98", text)
+        self.assertEqual(text.count("# TYPE buybacks2_esi_requests counter"), 1)
+        self.assertEqual(text.count('{status="200"}'), 1)
+
+    def test_should_register_series_again_when_lost(self):
+        sink = PrometheusSink()
+        sink.incr("esi_requests", 1, {"status": 200})
+        sink.flush()
+        cache.clear()
+
+        sink.incr("esi_requests", 1, {"status": 200})
+        text = sink.render()
+
+        self.assertIn('buybacks2_esi_requests_total{status="200"} 1', text)
@@ -0,0 +1,348 @@
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..models import (
+    Contract,
+    ContractItem,
+    Corporation,
+    Notification,
+    RawContract,
+    SyncRun,
+)
+from ..utils import items_signature
+from .esi_stub import StubESI
+from .testdata import (
+    create_character,
+    create_corporation,
+    create_notification,
+    create_raw_contract,
+    esi_contract,
+)
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+class EsiStubTestCase(TestCase):
+    """runs the ESI stub and lets the corp use it with a dummy token"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.esi = StubESI().start()
+        cls.esi_client = cls.esi.client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.esi.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.esi.contracts = []
+        self.esi.contract_items = {}
+        self.esi.failures = {}
+        self.esi.requests = []
+        esi_client_patcher = patch(
+            "buybacks2.helpers._esi_client", return_value=self.esi_client
+        )
+        esi_client_patcher.start()
+        self.addCleanup(esi_client_patcher.stop)
+        token_patcher = patch.object(
+            Corporation,
+            "token",
+            return_value=(Mock(expired=False, access_token="access_token"), 0),
+        )
+        token_patcher.start()
+        self.addCleanup(token_patcher.stop)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestNotificationMatchContract(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.corporation = create_corporation()
+        self.ownership = create_character(1002)
+
+    def test_should_match_stored_contract(self):
+        notification = create_notification(self.ownership, 1000000, {"34": 100})
+        create_raw_contract(
+            self.corporation,
+            5001,
+            1002,
+            1000000.0,
+            items_signature=items_signature({34: 100}),
+        )
+
+        self.assertTrue(notification.match_contract())
+
+        contract = Contract.objects.get(id=5001)
+        self.assertEqual(contract.character, self.ownership)
+        self.assertEqual(contract.total, 1000000)
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(RawContract.objects.exists())
+
+    def test_should_not_match_contract_with_other_items(self):
+        notification = create_notification(self.ownership, 1000000, {"34": 100})
+        create_raw_contract(
+            self.corporation,
+            5001,
+            1002,
+            1000000.0,
+            items_signature=items_signature({35: 100}),
+        )
+
+        self.assertFalse(notification.match_contract())
+        self.assertFalse(Contract.objects.exists())
+        self.assertTrue(Notification.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestCorporationMatchContracts(EsiStubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.corporation = create_corporation()
+        self.ownership = create_character(1002)
+        self.esi.contract_items = {
+            5001: [
+                {"record_id": 1, "type_id": 34, "quantity": 60, "is_included": True},
+                {"record_id": 2, "type_id": 34, "quantity": 40, "is_included": True},
+            ],
+            5002: [
+                {"record_id": 3, "type_id": 35, "quantity": 50, "is_included": True}
+            ],
+            5003: [
+                {"record_id": 4, "type_id": 36, "quantity": 10, "is_included": True}
+            ],
+        }
+        for contract_id in self.esi.contract_items:
+            create_raw_contract(self.corporation, contract_id, 1002, 1000000.0)
+
+    def test_should_match_contracts_with_notifications(self):
+        create_notification(self.ownership, 1000000, {"34": 100})
+        create_notification(self.ownership, 1000000, {"35": 50})
+
+        self.corporation.match_contracts()
+
+        self.assertEqual(
+            set(Contract.objects.values_list("id", flat=True)), {5001, 5002}
+        )
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(
+            list(RawContract.objects.values_list("id", "items_signature")),
+            [(5003, items_signature({36: 10}))],
+        )
+        self.assertEqual(
+            list(ContractItem.objects.values_list("contract_id", flat=True)), [5003]
+        )
+
+    def test_should_fetch_items_only_once(self):
+        self.corporation.match_contracts()
+        create_notification(self.ownership, 1000000, {"36": 10})
+        self.esi.contract_items = {}
+
+        self.corporation.match_contracts()
+
+        self.assertTrue(Contract.objects.filter(id=5003).exists())
+
+    def test_should_store_items_and_signatures_together(self):
+        with patch.object(
+            RawContract.objects, "bulk_update", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            self.corporation.match_contracts()
+
+        self.assertFalse(ContractItem.objects.exists())
+
+        self.corporation.match_contracts()
+
+        self.assertEqual(ContractItem.objects.filter(contract_id=5001).count(), 2)
+        self.assertEqual(
+            RawContract.objects.get(id=5001).items_signature,
+            items_signature({34: 100}),
+        )
+
+    def test_should_fetch_items_of_a_contract_in_one_worker_only(self):
+        create_notification(self.ownership, 1000000, {"34": 100})
+        fetched_contract_ids = []
+        contracts_items = Corporation._contracts_items
+
+        def run_other_worker(corporation, contract_ids, token):
+            fetched_contract_ids.append(contract_ids)
+            if len(fetched_contract_ids) == 1:
+                # other worker starts while the first one is fetching
+                corporation.match_contracts()
+            return contracts_items(corporation, contract_ids, token)
+
+        with patch.object(
+            Corporation, "_contracts_items", autospec=True
+        ) as mock_contracts_items:
+            mock_contracts_items.side_effect = run_other_worker
+            self.corporation.match_contracts()
+
+        self.assertEqual(fetched_contract_ids, [[5001, 5002, 5003]])
+        self.assertEqual(ContractItem.objects.filter(contract_id=5002).count(), 1)
+        self.assertTrue(Contract.objects.filter(id=5001).exists())
+
+    def test_should_fetch_items_without_holding_locks(self):
+        create_notification(self.ownership, 1000000, {"34": 100})
+        outer_savepoints = len(connection.savepoint_ids)
+        savepoints_while_fetching = []
+        contracts_items = Corporation._contracts_items
+
+        def record_savepoints(corporation, contract_ids, token):
+            savepoints_while_fetching.append(len(connection.savepoint_ids))
+            return contracts_items(corporation, contract_ids, token)
+
+        with patch.object(
+            Corporation, "_contracts_items", autospec=True
+        ) as mock_contracts_items:
+            mock_contracts_items.side_effect = record_savepoints
+            self.corporation.match_contracts()
+
+        self.assertEqual(savepoints_while_fetching, [outer_savepoints])
+        self.assertTrue(Contract.objects.filter(id=5001).exists())
+
+    def test_should_report_contracts_waiting_for_matching(self):
+        self.assertFalse(self.corporation.contracts_matching_due())
+
+        create_notification(self.ownership, 2000000, {"34": 100})
+        self.corporation.match_contracts()
+
+        self.assertTrue(self.corporation.contracts_matching_due())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestCorporationSyncContracts(EsiStubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.corporation = create_corporation()
+        self.now = timezone.now()
+
+    def sync_contracts(self) -> bool:
+        # ETags are stored once the transaction has been committed
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.corporation.sync_contracts_esi()
+
+    def contracts(self, pages: int) -> list:
+        """returns pages of two finished contracts each, newest first"""
+        return [
+            [
+                esi_contract(
+                    5000 + pages * 2 - num,
+                    self.now - timedelta(days=num),
+                )
+                for num in range(page * 2, page * 2 + 2)
+            ]
+            for page in range(pages)
+        ]
+
+    def test_should_store_buyback_contracts_and_watermark(self):
+        self.esi.contracts = [
+            [
+                esi_contract(5004, self.now, type="courier"),
+                esi_contract(5003, self.now, assignee_id=2002),
+                esi_contract(5002, self.now - timedelta(hours=1)),
+                esi_contract(5001, self.now - timedelta(hours=2)),
+            ]
+        ]
+
+        self.assertTrue(self.sync_contracts())
+
+        self.assertEqual(
+            set(RawContract.objects.values_list("id", flat=True)), {5001, 5002}
+        )
+        self.corporation.refresh_from_db()
+        self.assertEqual(self.corporation.contracts_watermark_id, 5004)
+
+    def test_should_keep_watermark_below_open_contracts(self):
+        self.esi.contracts = [
+            [
+                esi_contract(5003, self.now),
+                esi_contract(5002, self.now - timedelta(hours=1), status="outstanding"),
+                esi_contract(5001, self.now - timedelta(hours=2)),
+            ]
+        ]
+        self.sync_contracts()
+        self.corporation.refresh_from_db()
+        self.assertEqual(self.corporation.contracts_watermark_id, 5001)
+
+        self.esi.contracts[0][1]["status"] = "finished"
+        self.sync_contracts()
+
+        self.assertEqual(RawContract.objects.get(id=5002).status, "finished")
+        self.corporation.refresh_from_db()
+        self.assertEqual(self.corporation.contracts_watermark_id, 5003)
+
+    def test_should_stop_paging_at_watermark(self):
+        self.esi.contracts = self.contracts(8)
+        self.sync_contracts()
+        self.esi.contracts[0].insert(0, esi_contract(5100, self.now))
+        self.esi.requests = []
+
+        self.assertTrue(self.sync_contracts())
+
+        self.assertTrue(RawContract.objects.filter(id=5100).exists())
+        self.assertFalse(self.esi.contract_requests(page=8))
+
+    def test_should_report_unchanged_contracts_after_early_stop(self):
+        self.esi.contracts = self.contracts(8)
+        self.sync_contracts()
+        self.esi.contracts[0].insert(0, esi_contract(5100, self.now))
+        self.sync_contracts()
+        self.esi.requests = []
+
+        self.assertFalse(self.sync_contracts())
+        self.assertEqual(
+            sorted({page for page, _ in self.esi.requests}),
+            [1, 2],
+        )
+
+    def test_should_fetch_again_when_storing_failed(self):
+        self.esi.contracts = self.contracts(2)
+        self.sync_contracts()
+        self.esi.contracts[0].insert(0, esi_contract(5100, self.now))
+        with patch.object(
+            Corporation, "_store_raw_contracts", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            self.sync_contracts()
+
+        self.assertTrue(self.sync_contracts())
+        self.assertTrue(RawContract.objects.filter(id=5100).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestCorporationContractsSyncDue(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.corporation = create_corporation()
+
+    def record_sync_run(self, hours_ago: int):
+        started_at = timezone.now() - timedelta(hours=hours_ago)
+        SyncRun.objects.create(
+            corporation=self.corporation,
+            kind=SyncRun.KIND_CONTRACTS,
+            started_at=started_at,
+            finished_at=started_at,
+            success=True,
+        )
+
+    def test_should_sync_idle_corp_every_few_hours(self):
+        self.assertTrue(self.corporation.contracts_sync_due())
+
+        self.record_sync_run(hours_ago=7)
+        self.assertTrue(self.corporation.contracts_sync_due())
+
+        self.record_sync_run(hours_ago=1)
+        self.assertFalse(self.corporation.contracts_sync_due())
+
+    def test_should_sync_corp_with_notifications_once_expired(self):
+        self.record_sync_run(hours_ago=1)
+        create_notification(create_character(1002), 1000000, {"34": 100})
+
+        self.assertTrue(self.corporation.contracts_sync_due())
@@ -0,0 +1,56 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..tasks import sync_contracts_for_corp
+from .testdata import (
+    create_character,
+    create_corporation,
+    create_notification,
+    create_raw_contract,
+)
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@patch("buybacks2.tasks.match_contracts_for_corp")
+@patch("buybacks2.models.Corporation.sync_contracts_esi")
+class TestSyncContractsForCorp(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.corporation = create_corporation()
+        self.ownership = create_character(1002)
+
+    def test_should_match_when_contracts_have_changed(
+        self, mock_sync_contracts_esi, mock_match_contracts_for_corp
+    ):
+        mock_sync_contracts_esi.return_value = True
+
+        sync_contracts_for_corp(corp_pk=self.corporation.pk)
+
+        self.assertTrue(mock_match_contracts_for_corp.apply_async.called)
+
+    def test_should_match_again_when_contracts_are_waiting(
+        self, mock_sync_contracts_esi, mock_match_contracts_for_corp
+    ):
+        mock_sync_contracts_esi.return_value = False
+        create_notification(self.ownership, 1000000, {"34": 100})
+        create_raw_contract(self.corporation, 5001, 1002, 1000000.0)
+
+        sync_contracts_for_corp(corp_pk=self.corporation.pk)
+
+        self.assertTrue(mock_match_contracts_for_corp.apply_async.called)
+
+    def test_should_not_match_when_nothing_is_waiting(
+        self, mock_sync_contracts_esi, mock_match_contracts_for_corp
+    ):
+        mock_sync_contracts_esi.return_value = False
+        create_raw_contract(self.corporation, 5001, 1002, 1000000.0)
+
+        sync_contracts_for_corp(corp_pk=self.corporation.pk)
+
+        self.assertFalse(mock_match_contracts_for_corp.apply_async.called)
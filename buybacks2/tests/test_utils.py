@@ -0,0 +1,30 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from ..utils import clean_setting
+
+
+class TestCleanSetting(TestCase):
+    @override_settings(BUYBACKS2_HTTP_CACHE_BACKEND="sqlite")
+    def test_should_accept_one_of_the_choices(self):
+        self.assertEqual(
+            clean_setting(
+                "BUYBACKS2_HTTP_CACHE_BACKEND",
+                "filesystem",
+                choices=("filesystem", "sqlite"),
+            ),
+            "sqlite",
+        )
+
+    @override_settings(BUYBACKS2_HTTP_CACHE_BACKEND="redis")
+    def test_should_warn_and_use_default_for_other_values(self):
+        with patch("buybacks2.utils.logger") as mock_logger:
+            value = clean_setting(
+                "BUYBACKS2_HTTP_CACHE_BACKEND",
+                "filesystem",
+                choices=("filesystem", "sqlite"),
+            )
+
+        self.assertEqual(value, "filesystem")
+        self.assertTrue(mock_logger.warning.called)
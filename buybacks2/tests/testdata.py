@@ -0,0 +1,109 @@
+"""Objects for tests"""
+import json
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from allianceauth.authentication.models import CharacterOwnership
+from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
+
+from ..models import (
+    Corporation,
+    Location,
+    Notification,
+    Office,
+    Program,
+    ProgramLocation,
+    RawContract,
+)
+
+CORPORATION_ID = 2001
+LOCATION_ID = 60003760
+
+
+def create_character(character_id: int, user: User = None) -> CharacterOwnership:
+    """returns a character ownership for a new character of user"""
+    if user is None:
+        user = User.objects.create_user(f"user_{character_id}")
+    character = EveCharacter.objects.create(
+        character_id=character_id,
+        character_name=f"Character {character_id}",
+        corporation_id=CORPORATION_ID,
+        corporation_name="Buyback Corp",
+        corporation_ticker="BUY",
+    )
+    return CharacterOwnership.objects.create(
+        user=user, character=character, owner_hash=f"hash_{character_id}"
+    )
+
+
+def create_corporation() -> Corporation:
+    """returns a new corp with one office and a program at its location"""
+    corporation = Corporation.objects.create(
+        corporation=EveCorporationInfo.objects.create(
+            corporation_id=CORPORATION_ID,
+            corporation_name="Buyback Corp",
+            corporation_ticker="BUY",
+            member_count=1,
+        ),
+        character=create_character(1001),
+    )
+    office = Office.objects.create(
+        id=1,
+        corporation=corporation,
+        location=Location.objects.create(id=LOCATION_ID, name="Jita IV - Moon 4"),
+    )
+    ProgramLocation.objects.create(
+        program=Program.objects.create(corporation=corporation, name="Ore"),
+        office=office,
+    )
+    return corporation
+
+
+def create_notification(
+    ownership: CharacterOwnership, total: int, items: dict
+) -> Notification:
+    """returns a new notification of the user of ownership for the corp program"""
+    return Notification.objects.create(
+        program_location=ProgramLocation.objects.get(office__location_id=LOCATION_ID),
+        user=ownership.user,
+        total=total,
+        items=json.dumps(items),
+    )
+
+
+def create_raw_contract(
+    corporation: Corporation, contract_id: int, issuer_id: int, price: float, **kwargs
+) -> RawContract:
+    """returns a new finished contract waiting to be matched"""
+    date_issued = kwargs.pop("date_issued", timezone.now() - timedelta(hours=1))
+    params = {
+        "id": contract_id,
+        "corporation": corporation,
+        "issuer_id": issuer_id,
+        "start_location_id": LOCATION_ID,
+        "price": price,
+        "status": RawContract.STATUS_FINISHED,
+        "date_issued": date_issued,
+        "date_expired": date_issued + timedelta(days=14),
+    }
+    params.update(kwargs)
+    return RawContract.objects.create(**params)
+
+
+def esi_contract(contract_id: int, date_issued, **kwargs) -> dict:
+    """returns a contract as returned by ESI for a buyback to the corp"""
+    contract = {
+        "contract_id": contract_id,
+        "type": "item_exchange",
+        "status": "finished",
+        "assignee_id": CORPORATION_ID,
+        "issuer_id": 1002,
+        "start_location_id": LOCATION_ID,
+        "price": 1000000.0,
+        "date_issued": date_issued.isoformat(),
+        "date_expired": (date_issued + timedelta(days=14)).isoformat(),
+    }
+    contract.update(kwargs)
+    return contract
@@ -1,6 +1,6 @@
 from django.conf.urls import include, url
 
-from .views import common, notifications, programs, stats
+from .views import common, metrics, notifications, programs, stats
 
 app_name = "buybacks2"
 
@@ -14,6 +14,7 @@ module_urls = [
     ),
     url("my_notifications/", notifications.my_notifications, name="my_notifications"),
     url("my_stats/", stats.my_stats, name="my_stats"),
+    url("^metrics$", metrics.prometheus_metrics, name="metrics"),
     url(
         r"^notification/(?P<notification_pk>[0-9]+)/remove$",
         notifications.notification_remove,
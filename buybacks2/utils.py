@@ -1,4 +1,5 @@
 import logging
+from hashlib import md5
 
 from django.conf import settings
 from django.contrib import messages
@@ -131,11 +132,12 @@ def clean_setting(
     min_value: int = None,
     max_value: int = None,
     required_type: type = None,
+    choices: tuple = None,
 ):
     """cleans the input for a custom setting
 
     Will use `default_value` if settings does not exit or has the wrong type
-    or is outside define boundaries (for int only)
+    or is outside define boundaries (for int only) or is not one of `choices`
 
     Need to define `required_type` if `default_value` is `None`
 
@@ -159,6 +161,7 @@ def clean_setting(
             isinstance(getattr(settings, name), required_type)
             and (min_value is None or getattr(settings, name) >= min_value)
             and (max_value is None or getattr(settings, name) <= max_value)
+            and (choices is None or getattr(settings, name) in choices)
         ):
             cleaned_value = getattr(settings, name)
         else:
@@ -170,3 +173,17 @@ def clean_setting(
             )
             cleaned_value = default_value
     return cleaned_value
+
+
+def items_signature(quantities: dict) -> str:
+    """returns a canonical signature of items given as quantities by type ID,
+    which is equal for equal items regardless of their order
+    """
+    pairs = sorted(
+        (int(type_id), int(quantity))
+        for type_id, quantity in quantities.items()
+        if int(quantity)
+    )
+    return md5(
+        ",".join(f"{type_id}:{quantity}" for type_id, quantity in pairs).encode("utf-8")
+    ).hexdigest()
@@ -0,0 +1,22 @@
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .. import metrics
+from ..app_settings import BUYBACKS2_METRICS_SINK, BUYBACKS2_METRICS_TOKEN
+
+
+def prometheus_metrics(request):
+    if BUYBACKS2_METRICS_SINK != metrics.METRICS_SINK_PROMETHEUS:
+        raise Http404("Prometheus metrics are not enabled")
+
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    has_token = BUYBACKS2_METRICS_TOKEN and constant_time_compare(
+        authorization, f"Bearer {BUYBACKS2_METRICS_TOKEN}"
+    )
+    if not has_token and not request.user.has_perm("buybacks2.setup_retriever"):
+        raise PermissionDenied
+
+    return HttpResponse(
+        metrics.prometheus_text(), content_type="text/plain; version=0.0.4"
+    )
@@ -1,6 +1,7 @@
 import json
 
 from django.contrib.auth.decorators import login_required, permission_required
+from django.db import transaction
 from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import redirect, render
 from django.utils.html import format_html
@@ -10,6 +11,7 @@ from eveuniverse.models import EveType
 
 from ..forms import NotificationForm
 from ..models import Notification, Program, ProgramLocation
+from ..tasks import DEFAULT_TASK_PRIORITY, match_notification
 from ..utils import MessagesPlus
 
 
@@ -41,6 +43,8 @@ def program_notify(request, program_pk):
     if notification is None:
         return HttpResponseBadRequest("")
     else:
+        _match_notification_on_commit(notification.pk)
+
         MessagesPlus.success(
             request,
             format_html(
@@ -119,6 +123,7 @@ def notification_edit(request, notification_pk):
 
             try:
                 notification.save()
+                _match_notification_on_commit(notification.pk)
 
                 MessagesPlus.success(
                     request,
@@ -182,3 +187,15 @@ def process_notifications(notifications: dict) -> dict:
     for item in types:
         items[str(item.id)] = item.name
     return items
+
+
+def _match_notification_on_commit(notification_pk: int):
+    """queues matching of the notification once it has been committed,
+    so that the task can not run before the notification is visible to it
+    """
+    transaction.on_commit(
+        lambda: match_notification.apply_async(
+            kwargs={"notification_pk": notification_pk},
+            priority=DEFAULT_TASK_PRIORITY,
+        )
+    )
@@ -32,7 +32,6 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
@@ -40,7 +39,7 @@ setup(
         "Topic :: Internet :: WWW/HTTP",
         "Topic :: Internet :: WWW/HTTP :: Dynamic Content",
     ],
-    python_requires="~=3.6",
+    python_requires="~=3.7",
     install_requires=[
         "allianceauth>=2.9.0",
         "celery-once>=2.0.1",
@@ -48,6 +47,6 @@ setup(
         "django-eveuniverse>=0.6.1",
         "django-navhelper",
         "requests",
-        "requests-cache",
+        "requests-cache>=1.0",
     ],
 )
@@ -257,7 +257,10 @@ SITE_NAME = "testauth"
 DEBUG = False
 
 # Add any additional apps to this list.
-INSTALLED_APPS += []
+INSTALLED_APPS += [
+    "eveuniverse",
+    "buybacks2",
+]
 
 # Register an application at https://developers.eveonline.com for Authentication
 # & API Access and fill out these settings. Be sure to set the callback URL